@@ -9,6 +9,8 @@ import github3 as gh3
 from . import template
 from . import feedback as fdback
 from . import config as cf
+from .utils import parse_timestamp
+from .author import author_course
 from .quickstart import create_dir_struct
 from .clone import clone_student_repos
 
@@ -102,7 +104,8 @@ def clone():
 
     By default, if a local directory with the name of the repo already exists,
     pulls from github to update. Use the --skip-existing flag if you don't want
-    to update existing repos.
+    to update existing repos. Repos that have no new commits since the last
+    run are skipped (use --force to update them anyway).
     """
     parser = argparse.ArgumentParser(description=clone.__doc__)
     parser.add_argument(
@@ -116,6 +119,94 @@ def clone():
         help="""Do not attempt to update repositories that have already been
         cloned.""",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="""Number of repositories to clone or update at the same time
+        (default = 1).""",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="""Pull and copy files for every repository, even if it has not
+        changed since the last time abc-clone was run.""",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=None,
+        help="""Make shallow clones that only include the last DEPTH commits
+        (default = clone_depth in config.yml, or full history).""",
+    )
+    parser.add_argument(
+        "--blobless",
+        action="store_true",
+        default=None,
+        help="""Make partial clones that only download the contents of files
+        that are checked out (default = clone_blobless in config.yml).""",
+    )
+    parser.add_argument(
+        "--no-blobless",
+        dest="blobless",
+        action="store_false",
+        help="Make full clones, even if clone_blobless is set in config.yml.",
+    )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        default=None,
+        help="""Only check out notebook (.ipynb) and html feedback files
+        (default = clone_sparse in config.yml).""",
+    )
+    parser.add_argument(
+        "--no-sparse",
+        dest="sparse",
+        action="store_false",
+        help="Check out all files, even if clone_sparse is set in config.yml.",
+    )
+    parser.add_argument(
+        "--mirror-dir",
+        default=None,
+        help="""Keep a local bare mirror of each student repository in this
+        directory and clone from it, so repeated clones don't download the
+        same objects again (default = mirror_dir in config.yml).""",
+    )
+    parser.add_argument(
+        "--copy-mode",
+        choices=["copy", "hardlink", "reflink"],
+        default=None,
+        help="""How to put the notebooks in course_materials/submitted:
+        copy them, or hardlink or reflink them to the cloned notebooks so they
+        take no extra space. Hardlinked notebooks are made read-only, as
+        saving them would also change the cloned repo. Falls back to copying
+        when a link can't be made (default = submitted_copy_mode in
+        config.yml, or copy).""",
+    )
+    parser.add_argument(
+        "--student",
+        action="append",
+        default=None,
+        help="""Clone the repository for this student only (GitHub username or
+        identifier from the roster). Use several times to select several
+        students (default = all students in the roster).""",
+    )
+    parser.add_argument(
+        "--students-file",
+        default=None,
+        help="""File with the students to clone (GitHub usernames or
+        identifiers from the roster), one per line. Can be combined with
+        --student.""",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_timestamp,
+        default=None,
+        help="""Only clone the repositories that were pushed to at or after
+        this date and time, according to GitHub, e.g. 2020-10-01 or
+        "2020-10-01 17:00" (local time) or 2020-10-01T23:00:00Z (UTC).""",
+    )
     args = parser.parse_args()
 
     clone_student_repos(args)
@@ -145,10 +236,113 @@ def feedback():
         action="store_true",
         help="""Cleans out hidden tests from notebooks when used.""",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="""Number of students to copy and commit feedback for at the
+        same time (default = 1).""",
+    )
+    parser.add_argument(
+        "--push-jobs",
+        type=int,
+        default=4,
+        help="""Number of pushes to GitHub to run at the same time
+        (default = 4).""",
+    )
+    parser.add_argument(
+        "--student",
+        action="append",
+        default=None,
+        help="""Deliver feedback for this student only (GitHub username or
+        identifier from the roster). Use several times to select several
+        students (default = all students in the roster).""",
+    )
+    parser.add_argument(
+        "--students-file",
+        default=None,
+        help="""File with the students to deliver feedback to (GitHub
+        usernames or identifiers from the roster), one per line. Can be
+        combined with --student.""",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_timestamp,
+        default=None,
+        help="""Only deliver feedback to students who pushed to their
+        repository at or after this date and time, according to GitHub, e.g.
+        2020-10-01 or "2020-10-01 17:00" (local time) or
+        2020-10-01T23:00:00Z (UTC).""",
+    )
     args = parser.parse_args()
     fdback.copy_feedback(args)
 
 
+def author():
+    """
+    Create the student notebooks and autograder tests for the course by
+    splitting the master notebooks in course_materials/master/<assignment>.
+    Student notebooks (with the public tests) are written to
+    course_materials/student and the tests for the autograder to
+    course_materials/autograder. Notebooks that have not changed since the
+    last run are skipped (use --force to split them anyway).
+    """
+    parser = argparse.ArgumentParser(description=author.__doc__)
+    parser.add_argument(
+        "assignment",
+        nargs="*",
+        help="""Names of the assignments to author. Must match directory
+        names in course_materials/master (default = all assignments).""",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="""Number of notebooks to split at the same time (default =
+        number of CPUs).""",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="""Split every notebook, even if it has not changed since the
+        last time abc-author was run.""",
+    )
+    args = parser.parse_args()
+    author_course(args)
+
+
+def _add_template_assignment_arguments(parser):
+    """Add the arguments that select which templates to build, shared by
+    new_template and update_template."""
+    parser.add_argument(
+        "assignment",
+        nargs="*",
+        help="""Name of assignment(s). Must match names in
+        course_materials/release directory""",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="""Build a template for every assignment in the
+        course_materials/release directory.""",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help="""Number of templates to build at the same time
+        (default = 4).""",
+    )
+
+
+def _check_template_assignments(parser, args):
+    if args.all == bool(args.assignment):
+        parser.error("give one or more assignment names, or --all")
+
+
 def new_template():
     """
     Create a new assignment template repository: creates local directory,
@@ -157,11 +351,7 @@ def new_template():
     git editor to ask for commit message if custom message requested.
     """
     parser = argparse.ArgumentParser(description=new_template.__doc__)
-    parser.add_argument(
-        "assignment",
-        help="""Name of assignment. Must match name in
-        course_materials/release directory""",
-    )
+    _add_template_assignment_arguments(parser)
     parser.add_argument(
         "--custom-message",
         action="store_true",
@@ -182,10 +372,11 @@ def new_template():
         default="fail",
         help="""Action if template directory already exists. Choices are:
         delete = delete contents before proceeding (except .git directory);
-        merge = keep existing dir, overwrite existing files, add new files
-        (Default = fail).""",
+        merge = keep existing dir, update changed files, add new files and
+        remove files deleted from the release directory (Default = fail).""",
     )
     args = parser.parse_args()
+    _check_template_assignments(parser, args)
 
     template.new_update_template(args)
 
@@ -197,21 +388,18 @@ def update_template():
     to ask for commit message.
     """
     parser = argparse.ArgumentParser(description=update_template.__doc__)
-    parser.add_argument(
-        "assignment",
-        help="""Name of assignment. Must match name in course_materials/release
-        directory""",
-    )
+    _add_template_assignment_arguments(parser)
     parser.add_argument(
         "--mode",
         choices=["delete", "merge"],
         default="merge",
         help="""What to do with existing contents of template directory.
         Choices are: delete = remove contents before proceeding (leaving .git
-        directory); merge = overwrite existing files add new files
-        (Default = merge).""",
+        directory); merge = update changed files, add new files and remove
+        files deleted from the release directory (Default = merge).""",
     )
     args = parser.parse_args()
+    _check_template_assignments(parser, args)
     # now set the additional args (so that it matches the keys in add_template
     # and we can use the same implementation methods)
     setattr(args, "github", True)
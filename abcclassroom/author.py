@@ -0,0 +1,186 @@
+"""
+abc-classroom.author
+====================
+
+Create the student notebooks and autograder tests for a course by splitting
+all of the master notebooks, spread across a pool of processes.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import config as cf
+from .notebook import split_notebook
+
+# Name of the file in the course materials directory that records the
+# content hash of each master notebook the last time it was split
+MANIFEST_NAME = ".abc-author-manifest.json"
+
+
+def load_author_manifest(materials_dir):
+    """Read the author manifest. Returns a dictionary that maps the path of
+    each master notebook (relative to the master directory) to the sha256
+    hash of its contents when it was last split. Returns an empty dictionary
+    if there is no manifest yet."""
+    try:
+        with open(Path(materials_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_author_manifest(materials_dir, manifest):
+    """Write the author manifest (see ``load_author_manifest``)."""
+    with open(Path(materials_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def find_master_notebooks(master_dir, assignments=None):
+    """List the master notebooks of every assignment, i.e. every
+    ``master_dir/<assignment>/*.ipynb``.
+
+    Parameters
+    ----------
+    master_dir : string
+        Directory with one sub-directory of master notebooks per assignment.
+    assignments : list of strings (optional)
+        Only list the notebooks of these assignments. Defaults to all
+        assignments.
+
+    Returns
+    -------
+    list of (string, Path) tuples
+        The assignment name and path of each notebook, sorted by path.
+    """
+    notebooks = []
+    for notebook in sorted(Path(master_dir).glob("*/*.ipynb")):
+        assignment = notebook.parent.name
+        if assignments is not None and assignment not in assignments:
+            continue
+        notebooks.append((assignment, notebook))
+    return notebooks
+
+
+def hash_file(path):
+    """Return the sha256 hex digest of the contents of the file at path."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _split_one(notebook, student_path, autograder_path):
+    """Split a single master notebook and time it. Runs in a worker process.
+    Returns (seconds, error), where error is an empty string on success."""
+    start = time.perf_counter()
+    error = ""
+    try:
+        split_notebook(notebook, student_path, autograder_path)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    return round(time.perf_counter() - start, 2), error
+
+
+def author_assignments(assignments=None, jobs=None, force=False):
+    """Split the master notebooks of a course into student notebooks (with
+    public tests) and autograder tests.
+
+    Master notebooks live in ``course_materials/master/<assignment>``. The
+    student notebooks are written to ``course_materials/student/<assignment>``
+    and the tests for the autograder to
+    ``course_materials/autograder/<assignment>``. Notebooks whose contents
+    have not changed since they were last split are skipped.
+
+    Parameters
+    ----------
+    assignments : list of strings (optional)
+        Names of the assignments to author. Defaults to all assignments in
+        the master directory.
+    jobs : int (optional)
+        Number of notebooks to split at the same time. Defaults to the
+        number of CPUs on this machine.
+    force : boolean (default = False)
+        Split every notebook, even if it has not changed.
+    """
+    print("Loading configuration from config.yml")
+    config = cf.get_config()
+    paths = cf.get_course_paths(config, required=["course_materials"])
+    materials_path = paths.materials_dir
+    master_path = Path(materials_path, "master")
+
+    if not master_path.is_dir():
+        print(
+            "Oops! There is no master directory at {}. Put the master "
+            "notebooks for each assignment in master/<assignment>.".format(
+                master_path
+            )
+        )
+        return
+
+    notebooks = find_master_notebooks(master_path, assignments)
+    if not notebooks:
+        print("No master notebooks found in {}".format(master_path))
+        return
+
+    manifest = {} if force else load_author_manifest(materials_path)
+    to_split = []
+    for assignment, notebook in notebooks:
+        key = notebook.relative_to(master_path).as_posix()
+        digest = hash_file(notebook)
+        student_path = Path(materials_path, "student", assignment)
+        # re-split if the student notebook was removed since the last run
+        student_nb = Path(student_path, notebook.name)
+        if manifest.get(key) == digest and student_nb.exists():
+            print("{} has not changed; skipping".format(key))
+            continue
+        to_split.append((key, digest, notebook, student_path, assignment))
+
+    failures = []
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(
+                _split_one,
+                str(notebook),
+                str(student_path),
+                str(Path(materials_path, "autograder", assignment)),
+            )
+            for _, _, notebook, student_path, assignment in to_split
+        ]
+        for (key, digest, _, _, _), future in zip(to_split, futures):
+            seconds, error = future.result()
+            if error:
+                failures.append((key, error))
+                manifest.pop(key, None)
+            else:
+                print("Split {} in {:.2f}s".format(key, seconds))
+                manifest[key] = digest
+    write_author_manifest(materials_path, manifest)
+
+    print(
+        "Split {} of {} notebooks ({} unchanged).".format(
+            len(to_split) - len(failures),
+            len(notebooks),
+            len(notebooks) - len(to_split),
+        )
+    )
+    if failures:
+        print("Could not split the following notebooks:")
+        for key, error in failures:
+            print(" {}: {}".format(key, error))
+
+
+def author_course(args):
+    """This is the CLI implementation of author_assignments
+
+    Parameters
+    ----------
+    args : string argument inputs
+        Arguments include the names of the assignments (list of strings,
+        empty for all assignments), the number of parallel jobs (int) and
+        force (boolean)
+    """
+    author_assignments(args.assignment or None, args.jobs, args.force)
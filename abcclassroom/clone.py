@@ -4,15 +4,51 @@ abc-classroom.clone
 
 """
 
-import csv
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from shutil import copy
 
 from . import config as cf
 from . import github as gh
+from . import utils
+from .roster import Roster, select_pushed_since, students_from_args
 
+# Name of the file in clone_dir/assignment that records the commit we last
+# fetched for each student repo
+MANIFEST_NAME = ".abc-clone-manifest.json"
 
-def clone_or_update_repo(organization, repo, clone_dir, skip_existing):
+# What copy_assignment_files prints for each way of copying a file
+_MODE_VERBS = {
+    "copy": "copying",
+    "hardlink": "hardlinking",
+    "reflink": "reflinking",
+}
+
+
+def load_clone_manifest(assignment_dir):
+    """Read the clone manifest for an assignment. Returns a dictionary keyed
+    by repo name, where each value is a dictionary with the ``sha`` of the
+    last fetched commit and the time it was ``fetched`` (ISO 8601, UTC).
+    Returns an empty dictionary if there is no manifest yet."""
+    try:
+        with open(Path(assignment_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_clone_manifest(assignment_dir, manifest):
+    """Write the clone manifest for an assignment (see
+    ``load_clone_manifest``)."""
+    with open(Path(assignment_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def clone_or_update_repo(
+    organization, repo, clone_dir, skip_existing, clone_options=None
+):
     """
     Tries to clone the single repository 'repo' from the organization. If the
     local repository already exists, pulls instead of cloning (unless the
@@ -28,7 +64,12 @@ def clone_or_update_repo(organization, repo, clone_dir, skip_existing):
         Name of the clone directory.
     skip_existing : boolean
         True if you wish to skip copying files to existing repos.
+    clone_options : dict (optional)
+        Keyword arguments for ``github.clone_repo`` (depth, blobless,
+        sparse, reference) used when the repo is cloned for the first time.
     """
+    if clone_options is None:
+        clone_options = {}
     destination_dir = Path(clone_dir, repo)
     if destination_dir.is_dir():
         # if path exists, pull instead of clone (unless skip_existing)
@@ -41,7 +82,7 @@ def clone_or_update_repo(organization, repo, clone_dir, skip_existing):
             return
         gh.pull_from_github(destination_dir)
     else:
-        gh.clone_repo(organization, repo, clone_dir)
+        gh.clone_repo(organization, repo, clone_dir, **clone_options)
 
 
 def clone_student_repos(args):
@@ -50,18 +91,137 @@ def clone_student_repos(args):
     Parameters
     ----------
     args : string argument inputs
-        Arguments include the assignment name (string) and skip existing (
-        boolean?)
+        Arguments include the assignment name (string), skip existing (
+        boolean?), the number of parallel jobs (int), force (boolean) and
+        the shallow / partial clone options depth (int), blobless (boolean),
+        sparse (boolean) and mirror_dir (string), the students to clone:
+        student (list of strings), students_file (string) and since
+        (datetime), and how to copy the notebooks: copy_mode (string)
 
     """
 
     assignment_name = args.assignment
     skip_existing = args.skip_existing
+    jobs = args.jobs
+    force = args.force
+
+    clone_repos(
+        assignment_name,
+        skip_existing,
+        jobs,
+        force,
+        depth=args.depth,
+        blobless=args.blobless,
+        sparse=args.sparse,
+        mirror_dir=args.mirror_dir,
+        selected_students=students_from_args(args),
+        since=args.since,
+        copy_mode=args.copy_mode,
+    )
 
-    clone_repos(assignment_name, skip_existing)
 
+def clone_and_copy_repo(
+    config,
+    organization,
+    student,
+    assignment_name,
+    skip_existing,
+    repo_index=None,
+    last_fetch=None,
+    clone_options=None,
+    mirror_dir=None,
+    copy_mode="copy",
+):
+    """Clones or updates the repo for a single student and then (if a
+    course_materials directory is set in the config) copies the notebook
+    files into the 'submitted' directory. This is the unit of work that
+    ``clone_repos`` runs for each student, possibly in parallel.
+
+    Parameters
+    ----------
+    config : dict
+        config file returned as a dictionary from get_config()
+    organization : string
+        Organization where your GitHub classroom lives.
+    student : string
+        The github username of the student.
+    assignment_name : string
+        The name of the assignment to clone the repo for.
+    skip_existing : boolean
+        True if you wish to skip updating repos that already exist locally.
+    repo_index : dict (optional)
+        Index of the repositories in the organization, as returned by
+        ``github.get_repo_index``. If provided, repos that are not in the
+        index are reported as missing without trying to clone them.
+    last_fetch : dict (optional)
+        The clone manifest entry for this repo from the previous run. If the
+        local repo exists and the remote HEAD is still the commit recorded
+        here, the pull and the copy into 'submitted' are skipped.
+    clone_options : dict (optional)
+        Keyword arguments for ``github.clone_repo`` (depth, blobless,
+        sparse).
+    mirror_dir : string (optional)
+        Directory holding local bare mirrors of the student repos. If set,
+        the mirror for this repo is updated first and new clones borrow its
+        objects instead of downloading them from GitHub.
+    copy_mode : string (default = "copy")
+        How to put the notebooks in the 'submitted' directory (see
+        ``copy_assignment_files``).
+
+    Returns
+    -------
+    dict
+        The new clone manifest entry for the repo. Raises RuntimeError if git
+        fails.
+    """
+    paths = cf.get_course_paths(config, required=["clone_dir"])
+    clone_dir = paths.clone_dir
+    repo = "{}-{}".format(assignment_name, student)
+    if repo_index is not None and repo.lower() not in repo_index:
+        raise RuntimeError(
+            "Repository {} does not exist in {}".format(repo, organization)
+        )
+    destination_dir = Path(clone_dir, assignment_name, repo)
+    if last_fetch is not None and destination_dir.is_dir():
+        remote_head = gh.get_remote_head(organization, repo)
+        if remote_head == last_fetch["sha"]:
+            print("No new commits in {}; skipping".format(repo))
+            return last_fetch
+
+    if mirror_dir is not None and not (
+        skip_existing and destination_dir.is_dir()
+    ):
+        mirror = gh.update_mirror(organization, repo, mirror_dir)
+        clone_options = dict(clone_options or {}, reference=mirror)
 
-def clone_repos(assignment_name, skip_existing):
+    clone_or_update_repo(
+        organization,
+        repo,
+        Path(clone_dir, assignment_name),
+        skip_existing,
+        clone_options,
+    )
+    if paths.materials_dir is not None:
+        copy_assignment_files(config, student, assignment_name, copy_mode)
+    return {
+        "sha": gh.get_fetched_head(destination_dir),
+        "fetched": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def clone_repos(
+    assignment_name,
+    skip_existing,
+    jobs=1,
+    force=False,
+    depth=None,
+    blobless=None,
+    sparse=None,
+    mirror_dir=None,
+    selected_students=None,
+    since=None,
+    copy_mode=None,
+):
     """Iterates through the student roster, clones each repo for this
     assignment into the directory specified in the config, and then copies the
     notebook files into the 'course_materials/submitted' directory, based on
@@ -72,7 +232,43 @@ def clone_repos(assignment_name, skip_existing):
     assignment_name : string
         The name of the assignment to clone repos for
     skip_existing : boolean
-        Not sure what this does yet!
+        True if you do not want to update repos that have already been cloned
+    jobs : int (default = 1)
+        Number of repositories to clone or update at the same time. Cloning
+        is mostly waiting on the network, so values larger than the number
+        of cores on your machine are fine.
+    force : boolean (default = False)
+        If True, pull and copy files for every repo, even those whose remote
+        HEAD has not changed since the commit recorded in the clone manifest
+        on the last run.
+    depth : int (optional)
+        Make shallow clones with only the last `depth` commits. Defaults to
+        the ``clone_depth`` option in config.yml (full clones if not set).
+    blobless : boolean (optional)
+        Make partial clones that only download the files that are checked
+        out. If None, uses the ``clone_blobless`` option in config.yml
+        (False if not set); pass False to make full clones even if the
+        option is set.
+    sparse : boolean (optional)
+        Only check out notebook (and html feedback) files. If None, uses the
+        ``clone_sparse`` option in config.yml (False if not set); pass False
+        to check out all files even if the option is set.
+    mirror_dir : string (optional)
+        Keep a local bare mirror of each student repo in this directory and
+        clone from it, so that repeated clones reuse objects that were
+        already downloaded. Defaults to the ``mirror_dir`` option in
+        config.yml (no mirrors if not set). Relative paths are relative to
+        the course directory.
+    selected_students : list of strings (optional)
+        Only clone the repos of these students (GitHub usernames or roster
+        identifiers). Defaults to everyone in the roster.
+    since : datetime (optional)
+        Only clone the repos that were pushed to at or after this (timezone
+        aware) time, according to GitHub.
+    copy_mode : string (optional)
+        How to put the notebooks in the 'submitted' directory: "copy",
+        "hardlink" or "reflink" (see ``utils.link_file``). Defaults to the
+        ``submitted_copy_mode`` option in config.yml ("copy" if not set).
 
     Returns
     --------
@@ -82,13 +278,40 @@ def clone_repos(assignment_name, skip_existing):
 
     print("Loading configuration from config.yml")
     config = cf.get_config()
-    roster_filename = cf.get_config_option(config, "roster", True)
-    course_dir = cf.get_config_option(config, "course_directory", True)
-    clone_dir = cf.get_config_option(config, "clone_dir", True)
+    paths = cf.get_course_paths(config, required=["roster", "clone_dir"])
+    roster_filename = paths.roster
     organization = cf.get_config_option(config, "organization", True)
-    materials_dir = cf.get_config_option(config, "course_materials", False)
 
-    if materials_dir is None:
+    # Command line options override the clone options in the config
+    if depth is None:
+        depth = cf.get_config_option(config, "clone_depth", False)
+    if blobless is None:
+        blobless = cf.get_config_option(config, "clone_blobless", False)
+    if sparse is None:
+        sparse = cf.get_config_option(config, "clone_sparse", False)
+    clone_options = {
+        "depth": depth,
+        "blobless": bool(blobless),
+        "sparse": bool(sparse),
+    }
+    if mirror_dir is None:
+        mirror_dir = cf.get_config_option(config, "mirror_dir", False)
+    if mirror_dir is not None:
+        mirror_dir = utils.get_abspath(mirror_dir, str(paths.course_dir))
+
+    if copy_mode is None:
+        copy_mode = cf.get_config_option(config, "submitted_copy_mode", False)
+    if copy_mode is None:
+        copy_mode = "copy"
+    if copy_mode not in utils.LINK_MODES:
+        print(
+            "Oops! submitted_copy_mode must be one of {}, not {}".format(
+                ", ".join(utils.LINK_MODES), copy_mode
+            )
+        )
+        sys.exit(1)
+
+    if paths.materials_dir is None:
         print(
             "Oops! I couldn't find a course_materials directory location "
             "in your config.yml file. I will just clone all of the student"
@@ -98,48 +321,69 @@ def clone_repos(assignment_name, skip_existing):
 
     try:
         # Create the assignment subdirectory path and ensure it exists
-        Path(course_dir, clone_dir, assignment_name).mkdir(exist_ok=True)
+        assignment_dir = Path(paths.clone_dir, assignment_name)
+        assignment_dir.mkdir(exist_ok=True)
+        manifest = {} if force else load_clone_manifest(assignment_dir)
         missing_repos = []
-        missing_student_gh = []
-
-        with open(roster_filename, newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            try:
-                for row in reader:
-                    student = row["github_username"]
-                    print(student)
-                    # If there is no student gh name skip trying to clone
-                    if not student:
-                        missing_student_gh.append(row)
-                    else:
-                        # Expected columns: identifier,github_username,
-                        # github_id,name
-                        repo = "{}-{}".format(assignment_name, student)
-                        try:
-                            clone_or_update_repo(
-                                organization,
-                                repo,
-                                Path(clone_dir, assignment_name),
-                                skip_existing,
-                            )
-                            if materials_dir is not None:
-                                copy_assignment_files(
-                                    config, student, assignment_name
-                                )
-                        except RuntimeError:
-                            missing_repos.append(repo)
-            except KeyError as ke:
-                raise KeyError(
-                    "Oops! Please check your roster file to "
-                    "ensure is has the correct "
-                    "headers. {}".format(ke)
+
+        roster = Roster.from_csv(roster_filename)
+        if selected_students is not None:
+            roster = roster.filter(selected_students)
+        # If there is no student gh name skip trying to clone
+        missing_student_gh = roster.missing_usernames
+
+        # List the organization's repos once so that we don't try to clone
+        # repos that don't exist (e.g. the student hasn't accepted the
+        # assignment yet)
+        repo_index = gh.get_repo_index(organization)
+        if since is not None:
+            roster = select_pushed_since(
+                roster, repo_index, assignment_name, since
+            )
+
+        students = roster.usernames
+        for student in students:
+            print(student)
+
+        # Clone (or pull) and copy files for each student. The futures are
+        # collected in roster order so that the summary below is the same
+        # no matter which order the jobs finish in.
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [
+                executor.submit(
+                    clone_and_copy_repo,
+                    config,
+                    organization,
+                    student,
+                    assignment_name,
+                    skip_existing,
+                    repo_index,
+                    manifest.get("{}-{}".format(assignment_name, student)),
+                    clone_options,
+                    mirror_dir,
+                    copy_mode,
                 )
+                for student in students
+            ]
+            for student, future in zip(students, futures):
+                repo = "{}-{}".format(assignment_name, student)
+                try:
+                    manifest[repo] = future.result()
+                except RuntimeError:
+                    missing_repos.append(repo)
+        write_clone_manifest(assignment_dir, manifest)
+
         if len(missing_repos) == 0 and len(missing_student_gh) == 0:
             print("Great! All repos were successfully cloned!")
         else:
             # Two potential points of failure 1. github repo doesn't exist or
             # 2. missing gh username. Here the message is clear about what
             # is wrong
+            print(
+                "Cloned or updated {} of {} repos.".format(
+                    len(students) - len(missing_repos), len(students)
+                )
+            )
             if len(missing_repos) > 0:
                 print("Could not clone or update the following repos: ")
                 for r in missing_repos:
@@ -151,7 +395,7 @@ def clone_repos(assignment_name, skip_existing):
                     "roster accordingly:"
                 )
                 for astudent in missing_student_gh:
-                    print(" {}".format(astudent))
+                    print(" {}".format(astudent.identifier))
 
     except FileNotFoundError as err:
         raise FileNotFoundError(
@@ -160,7 +404,7 @@ def clone_repos(assignment_name, skip_existing):
         print(err)
 
 
-def copy_assignment_files(config, student, assignment_name):
+def copy_assignment_files(config, student, assignment_name, mode="copy"):
     """Copies all notebook files from clone_dir to course_materials/submitted.
     Will overwrite any existing files with the same name.
 
@@ -171,19 +415,24 @@ def copy_assignment_files(config, student, assignment_name):
     student:
     assignment_name: string
         Name of the assignment for which files are being copied
+    mode: string (default = "copy")
+        "copy", or "hardlink" or "reflink" to link the files instead of
+        copying them, so that they take (almost) no extra space. Falls back
+        to copying files that can't be linked. See ``utils.link_file``.
 
     """
-    course_dir = cf.get_config_option(config, "course_directory", True)
-    materials_dir = cf.get_config_option(config, "course_materials", False)
-    clone_dir = cf.get_config_option(config, "clone_dir", True)
+    paths = cf.get_course_paths(
+        config, required=["clone_dir", "course_materials"]
+    )
+    clone_dir = paths.clone_dir
     repo = "{}-{}".format(assignment_name, student)
 
     # Copy files from the cloned_dirs/assignment name directory
     # TODO - right now this ONLY copies notebooks but we may want to copy
     # other file types like .py files as well.
-    files = Path(course_dir, clone_dir, assignment_name, repo).glob("*.ipynb")
+    files = Path(clone_dir, assignment_name, repo).glob("*.ipynb")
     destination = Path(
-        course_dir, materials_dir, "submitted", student, assignment_name
+        paths.materials_dir, "submitted", student, assignment_name
     )
     destination.mkdir(parents=True, exist_ok=True)
     print(
@@ -199,5 +448,12 @@ def copy_assignment_files(config, student, assignment_name):
     # tho it's adding a bit of additional steps - it's still a very small
     # operation
     for f in files:
-        print("copying {} to {}".format(f, destination))
-        copy(f, destination)
+        used = utils.link_file(f, Path(destination, f.name), mode)
+        if used == mode:
+            print("{} {} to {}".format(_MODE_VERBS[used], f, destination))
+        else:
+            print(
+                "Could not {} {}; copied it to {} instead".format(
+                    mode, f, destination
+                )
+            )
@@ -4,13 +4,115 @@ abc-classroom.config
 
 """
 
+import copy
+import os
 import sys
 import pprint
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
 from pathlib import Path
 import os.path as op
 
 from ruamel.yaml import YAML
 
+from . import utils
+
+TOKEN_FILE = "~/.abc-classroom.tokens.yml"
+
+# Seconds to wait for another process (or thread) to finish editing the
+# config, see edit_config
+LOCK_TIMEOUT = 10
+
+# One YAML instance for every file we read and write. It isn't thread safe,
+# so it is only used while holding the lock.
+_yaml = YAML()
+_yaml_lock = threading.Lock()
+
+# Parsed yaml files, keyed by absolute path. Each value is the (mtime, size)
+# of the file when it was parsed and the parsed contents, so a file is only
+# parsed again after it changes.
+_file_cache = {}
+
+# Absolute paths from the config, see get_course_paths. Any of them except
+# course_dir is None if it is not set in the config.
+CoursePaths = namedtuple(
+    "CoursePaths",
+    ["course_dir", "materials_dir", "clone_dir", "template_dir", "roster"],
+)
+
+# The config option for each of the CoursePaths
+_course_path_options = {
+    "course_dir": "course_directory",
+    "materials_dir": "course_materials",
+    "clone_dir": "clone_dir",
+    "template_dir": "template_dir",
+    "roster": "roster",
+}
+
+
+def _load_yaml(path):
+    """
+    Load the yaml file at path, using the cached copy if the file has not
+    changed since it was last parsed. Returns a copy that the caller is free
+    to modify. Raises FileNotFoundError if there is no such file.
+    """
+    path = op.abspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _yaml_lock:
+        cached = _file_cache.get(path)
+        if cached is None or cached[0] != signature:
+            with open(path) as f:
+                cached = (signature, _yaml.load(f))
+            _file_cache[path] = cached
+        return copy.deepcopy(cached[1])
+
+
+def _dump_yaml(data, path):
+    """Write data to the yaml file at path. The yaml is written to a
+    temporary file next to it first, which then replaces the file, so a
+    crash part way through can't leave a truncated file behind."""
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with _yaml_lock:
+        try:
+            with open(tmp_path, "w") as f:
+                _yaml.dump(data, f)
+            os.replace(tmp_path, path)
+        finally:
+            if op.exists(tmp_path):
+                os.remove(tmp_path)
+        _file_cache.pop(op.abspath(path), None)
+
+
+@contextmanager
+def _locked(path, timeout=LOCK_TIMEOUT):
+    """
+    Hold an exclusive lock on path, by creating path + ".lock" (which fails
+    if it already exists, in this or any other process). Waits up to
+    timeout seconds for another holder to let go.
+    """
+    lock_path = "{}.lock".format(path)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    "Could not lock {} because {} exists. If no other "
+                    "abc-classroom command is running, delete it and try "
+                    "again.".format(path, lock_path)
+                )
+            time.sleep(0.05)
+    try:
+        os.close(fd)
+        yield
+    finally:
+        os.remove(lock_path)
+
 
 def get_github_auth():
     """
@@ -23,10 +125,8 @@ def get_github_auth():
         Yaml object that contains the token and id for a github session.
         If yaml doesn't exists, return an empty dictionary.
     """
-    yaml = YAML()
     try:
-        with open(op.expanduser("~/.abc-classroom.tokens.yml")) as f:
-            config = yaml.load(f)
+        config = _load_yaml(op.expanduser(TOKEN_FILE))
         return config["github"]
 
     except FileNotFoundError:
@@ -44,28 +144,28 @@ def set_github_auth(auth_info):
         The token and id authentication information from github stored in a
         dictionary object.
     """
-    yaml = YAML()
-    config = {}
-    if get_github_auth():
-        with open(op.expanduser("~/.abc-classroom.tokens.yml")) as f:
-            config = yaml.load(f)
+    try:
+        config = _load_yaml(op.expanduser(TOKEN_FILE))
+    except FileNotFoundError:
+        config = {}
 
     config["github"] = auth_info
 
-    with open(op.expanduser("~/.abc-classroom.tokens.yml"), "w") as f:
-        yaml.dump(config, f)
+    _dump_yaml(config, op.expanduser(TOKEN_FILE))
 
 
 def get_config(configpath=None):
-    yaml = YAML()
+    """
+    Load config.yml from configpath (or the current working directory).
+    The file is only parsed the first time, and again after it changes;
+    each call returns a fresh copy of the config.
+    """
     try:
         if configpath is None:
             configpath = Path("config.yml")
         else:
             configpath = Path(configpath, "config.yml")
-        with open(configpath) as f:
-            config = yaml.load(f)
-        return config
+        return _load_yaml(configpath)
     except FileNotFoundError:
         configpath.resolve()
         print(
@@ -95,13 +195,11 @@ def print_config(config=None, configpath=None):
 
 
 def write_config(config, configpath=None):
-    yaml = YAML()
     if configpath is None:
         configpath = Path("config.yml")
     else:
         configpath = Path(configpath, "config.yml")
-    with open(configpath, "w") as f:
-        yaml.dump(config, f)
+    _dump_yaml(config, configpath)
 
 
 # TODO: allow for nested gets, e.g. config[a][b]
@@ -126,16 +224,47 @@ def get_config_option(config, option, required=True):
             return None
 
 
-def set_config_option(
-    config, option, value, append_value=False, configpath=None
-):
+def get_course_paths(config, required=()):
     """
-    Sets a config option. If option already exists and append_value is False,
-    replaces existing value. If option exists and append_value is true, adds
-    new value to list of existing values. Will not add a duplicate value.
+    Get the course directory and the other course paths from the config as
+    absolute paths. Paths in the config that are not absolute are relative
+    to the course directory.
 
-    Writes the new config (overwriting the existing file) and returns new
-    config dict.
+    Parameters
+    ----------
+    config : dict
+        config file returned as a dictionary from get_config()
+    required : list of strings
+        Config options (e.g. "clone_dir") that must be set. If one is
+        missing, exits the same way as get_config_option. course_directory
+        is always required.
+
+    Returns
+    -------
+    CoursePaths
+        Named tuple of Path objects with fields course_dir, materials_dir,
+        clone_dir, template_dir and roster. Fields for options that are not
+        set in the config are None.
+    """
+    course_dir = get_config_option(config, "course_directory", True)
+    paths = {}
+    for field, option in _course_path_options.items():
+        value = get_config_option(config, option, option in required)
+        if value is not None:
+            value = Path(utils.get_abspath(str(value), str(course_dir)))
+        paths[field] = value
+    return CoursePaths(**paths)
+
+
+def update_config_option(config, option, value, append_value=False):
+    """
+    Sets a config option in the config dictionary, without writing it. If
+    option already exists and append_value is False, replaces existing
+    value. If option exists and append_value is true, adds new value to list
+    of existing values. Will not add a duplicate value, and keeps the order
+    of the values.
+
+    Returns the modified config dict.
     """
 
     existing_value = get_config_option(config, option, required=False)
@@ -145,9 +274,50 @@ def set_config_option(
             value = existing_value
         else:
             value = [existing_value, value]
-        # eliminate duplicates
-        value = list(set(value))
+        # eliminate duplicates, keeping the first of each
+        value = list(dict.fromkeys(value))
     config[option] = value
+    return config
+
+
+def set_config_option(
+    config, option, value, append_value=False, configpath=None
+):
+    """
+    Sets a config option (see update_config_option).
+
+    Writes the new config (overwriting the existing file) and returns new
+    config dict. To make several changes with a single write, or to change
+    the config while other processes might be changing it too, use
+    edit_config instead.
+    """
+    update_config_option(config, option, value, append_value)
     print("Writing modified config at {}".format(configpath))
     write_config(config, configpath)
     return config
+
+
+@contextmanager
+def edit_config(configpath=None):
+    """
+    Context manager for changing config.yml in configpath (or the current
+    working directory) as a single transaction. The config file is locked
+    (config.yml.lock), re-read from disk, and the config dictionary is
+    handed to the body of the with statement to change (e.g. with
+    update_config_option). When the body finishes, the config is written
+    once, replacing the old file in one step. If the body raises, nothing
+    is written. ::
+
+        with edit_config(course_dir) as config:
+            update_config_option(config, "assignments", "hw1", True)
+            update_config_option(config, "assignments", "hw2", True)
+    """
+    if configpath is None:
+        path = Path("config.yml")
+    else:
+        path = Path(configpath, "config.yml")
+    with _locked(path):
+        config = get_config(configpath)
+        yield config
+        print("Writing modified config at {}".format(path))
+        write_config(config, configpath)
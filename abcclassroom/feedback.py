@@ -3,24 +3,219 @@ abc-classroom.feedback
 ======================
 """
 
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
-import csv
+import hashlib
+import json
 import shutil
 
 from . import config as cf
 from . import github
+from .roster import Roster, select_pushed_since, students_from_args
 
 # or import just the function we need?
 from . import scrub_feedback as sf
 
+# Name of the file in the feedback directory that records the sha256 hash
+# of each html report after it was scrubbed, so reports that are already
+# clean are not scrubbed again
+SCRUB_CACHE_NAME = ".abc-scrub-cache.json"
 
-def copy_feedback_files(assignment_name, push_to_github=False, scrub=False):
+# Number of bytes of a report hashed at a time
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(path):
+    """sha256 hex digest of the file at path, read in chunks so that large
+    reports are never loaded into memory whole."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scrub_one(html_path, scrubbed_hash):
+    """Scrub a single html report, unless its contents hash to
+    scrubbed_hash (the hash it had after it was last scrubbed). Runs in a
+    worker process. Returns the hash of the scrubbed file and the number of
+    hidden test blocks removed (None if the file was skipped)."""
+    file_hash = _hash_file(html_path)
+    if file_hash == scrubbed_hash:
+        return file_hash, None
+    removed = sf.scrub_feedback(html_path)
+    if removed:
+        file_hash = _hash_file(html_path)
+    return file_hash, removed
+
+
+def scrub_feedback_files(
+    feedback_dir, assignment_name, jobs=None, students=None
+):
+    """Remove hidden tests from all of the html feedback reports for an
+    assignment, i.e. every feedback_dir/<student>/<assignment>/*.html.
+    Reports are scrubbed in place, spread across a pool of processes.
+
+    Parameters
+    ----------
+    feedback_dir: string or Path
+        The feedback directory in the course materials.
+    assignment_name: string
+        Name of the assignment for which feedback is being processed.
+    jobs: int (optional)
+        Number of reports to scrub at the same time. Defaults to the number
+        of CPUs on this machine.
+    students: list of strings (optional)
+        Only scrub the reports of these students (github usernames).
+        Defaults to all students with a feedback directory.
+
+    Returns
+    -------
+        The number of reports that hidden tests were removed from. The hash
+        of every scrubbed report is saved in the SCRUB_CACHE_NAME file in
+        feedback_dir, and reports that haven't changed since are skipped
+        the next time.
+    """
+    feedback_dir = Path(feedback_dir)
+    cache_path = Path(feedback_dir, SCRUB_CACHE_NAME)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        cache = {}
+
+    if students is None:
+        reports = feedback_dir.glob("*/{}/*.html".format(assignment_name))
+    else:
+        reports = [
+            report
+            for student in students
+            for report in Path(feedback_dir, student, assignment_name).glob(
+                "*.html"
+            )
+        ]
+    reports = sorted(reports)
+    if not reports:
+        # nothing to scrub (possibly no feedback directory at all)
+        return 0
+    keys = [report.relative_to(feedback_dir).as_posix() for report in reports]
+    scrubbed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_scrub_one, report, cache.get(key))
+            for report, key in zip(reports, keys)
+        ]
+        for key, future in zip(keys, futures):
+            cache[key], removed = future.result()
+            if removed:
+                print("Removed hidden tests from {}".format(key))
+                scrubbed += 1
+
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    return scrubbed
+
+
+def copy_student_feedback(config, student, assignment_name, repo_index=None):
+    """Copies the feedback reports for a single student into their local
+    repository. This is the first stage of the feedback pipeline in
+    ``copy_feedback_files``, which scrubs the reports (if requested) before
+    they are copied.
+
+    Parameters
+    -----------
+    config: dict
+        config file returned as a dictionary from get_config()
+    student: string
+        The github username of the student.
+    assignment_name: string
+        Name of the assignment for which feedback is being processed.
+    repo_index: dict (optional)
+        Index of the repositories in the organization, as returned by
+        ``github.get_repo_index``. If provided, students whose repo is not in
+        the index are skipped.
+
+    Returns
+    -------
+    destination_dir : Path or None
+        The local student repository the files were copied to, or None if
+        the student was skipped.
+    """
+    paths = cf.get_course_paths(
+        config, required=["clone_dir", "course_materials"]
+    )
+    course_dir = paths.course_dir
+    files_to_ignore = cf.get_config_option(config, "files_to_ignore", True)
+
+    feedback_path = Path(
+        paths.materials_dir, "feedback", student, assignment_name
+    )
+    source_files = list(feedback_path.glob("*.html"))
+    repo_name = "{}-{}".format(assignment_name, student)
+    # The repos now live in clone_dir/assignment-name/repo-name
+    destination_dir = Path(paths.clone_dir, assignment_name, repo_name)
+    if not destination_dir.is_dir():
+        print(
+            "Local student repository {} does not exist; skipping "
+            "student".format(destination_dir)
+        )
+        return None
+    if repo_index is not None and repo_name.lower() not in repo_index:
+        print(
+            "Student repository {} does not exist on GitHub; "
+            "skipping student".format(repo_name)
+        )
+        return None
+    # TODO: Turn this into a helper function
+    # Don't copy any system related files -- not this is exactly
+    # the same code used in the template.py copy files function.
+    # this could become a helper that just moves files. I think
+    # we'd call it a few times so it's worth doing... and when /
+    # if we add support to move directories we could just add it
+    # in one place.
+    # This won't work when the entire path is provided
+    # TODO: either parse files first and then create the site
+    #  and paths or figure out another approach with generator
+    # objects? maybe a list comprehension?
+    files_to_move = set(source_files).difference(files_to_ignore)
+
+    for f in files_to_move:
+        print(
+            "Copying {} to {}".format(
+                f.relative_to(course_dir), destination_dir
+            )
+        )
+        shutil.copy(f, destination_dir)
+    return destination_dir
+
+
+def copy_feedback_files(
+    assignment_name,
+    push_to_github=False,
+    scrub=False,
+    jobs=1,
+    push_jobs=4,
+    selected_students=None,
+    since=None,
+):
     """Copies feedback reports to local student repositories, commits the
     changes,
     and (optionally) pushes to github. Assumes files are in the directory
     course_materials/feedback/student/assignment. Copies all files in the
     source directory.
 
+    The work runs as a pipeline of three stages: copy, commit and push
+    (after scrubbing all of the reports with ``scrub_feedback_files``, if
+    ``scrub`` is set). Each stage has its own pool of workers, so pushes for
+    some students (which wait on the network) don't hold up copying and
+    committing for others. A failure for one student does not stop the
+    others; all failures are reported at the end.
+
     Parameters
     -----------
     assignment_name: string
@@ -31,6 +226,16 @@ def copy_feedback_files(assignment_name, push_to_github=False, scrub=False):
     scrub: boolean
         If true, and we are moving an html file this will clean the html file
         before copying it over.
+    jobs: int (default = 1)
+        Number of students to copy and commit feedback for at the same time.
+    push_jobs: int (default = 4)
+        Number of pushes to GitHub to run at the same time.
+    selected_students: list of strings (optional)
+        Only deliver feedback to these students (GitHub usernames or roster
+        identifiers). Defaults to everyone in the roster.
+    since: datetime (optional)
+        Only deliver feedback to students who pushed to their repo at or
+        after this (timezone aware) time, according to GitHub.
 
     Returns
     -------
@@ -43,70 +248,96 @@ def copy_feedback_files(assignment_name, push_to_github=False, scrub=False):
     config = cf.get_config()
 
     # Get various paths from config
-    # I think we do this a bunch so is it worth a helper for it?
-    roster_filename = cf.get_config_option(config, "roster", True)
-    course_dir = cf.get_config_option(config, "course_directory", True)
-    clone_dir = cf.get_config_option(config, "clone_dir", True)
-    materials_dir = cf.get_config_option(config, "course_materials", True)
-
-    try:
-        feedback_dir = Path(course_dir, materials_dir, "feedback")
-        with open(roster_filename, newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                student = row["github_username"]
-                feedback_path = Path(feedback_dir, student, assignment_name)
-                source_files = list(feedback_path.glob("*.html"))
-                repo_name = "{}-{}".format(assignment_name, student)
-                # The repos now live in clone_dir/assignment-name/repo-name
-                destination_dir = Path(clone_dir, assignment_name, repo_name)
-                if not destination_dir.is_dir():
-                    print(
-                        "Local student repository {} does not exist; skipping "
-                        "student".format(destination_dir)
-                    )
-                    continue
-                # TODO: Turn this into a helper function lines 46 - 64 here
-                # Don't copy any system related files -- not this is exactly
-                # the same code used in the template.py copy files function.
-                # this could become a helper that just moves files. I think
-                # we'd call it a few times so it's worth doing... and when /
-                # if we add support to move directories we could just add it
-                # in one place.
-                files_to_ignore = cf.get_config_option(
-                    config, "files_to_ignore", True
-                )
-                # This won't work when the entire path is provided
-                # TODO: either parse files first and then create the site
-                #  and paths or figure out another approach with generator
-                # objects? maybe a list comprehension?
-                files_to_move = set(source_files).difference(files_to_ignore)
-
-                for f in files_to_move:
-                    if scrub:
-                        # If f has an html extension and scrub is true
-                        # Clean the file and overwrite existing html
-                        sf.scrub_feedback(f)
-                        print("Removing hidden tests before copying")
-                    print(
-                        "Copying {} to {}".format(
-                            f.relative_to(course_dir), destination_dir
-                        )
-                    )
-                    shutil.copy(f, destination_dir)
+    paths = cf.get_course_paths(config, required=["roster"])
+    roster_filename = paths.roster
+    commit_message = "Adding feedback for assignment {}".format(
+        assignment_name
+    )
 
-                github.commit_all_changes(
-                    destination_dir,
-                    msg="Adding feedback for assignment {}".format(
-                        assignment_name
-                    ),
-                )
-                if push_to_github:
-                    github.push_to_github(destination_dir)
+    # If we are pushing, list the organization's repos once so that we can
+    # skip students whose repo no longer exists on GitHub (this also has the
+    # times the repos were last pushed to, for `since`)
+    repo_index = None
+    if push_to_github or since is not None:
+        organization = cf.get_config_option(config, "organization", True)
+        repo_index = github.get_repo_index(organization)
 
+    try:
+        roster = Roster.from_csv(roster_filename)
     except FileNotFoundError as err:
         print("Missing file or directory:")
         print(" ", err)
+        return
+    if selected_students is not None:
+        roster = roster.filter(selected_students)
+    if since is not None:
+        roster = select_pushed_since(
+            roster, repo_index, assignment_name, since
+        )
+    students = roster.usernames
+
+    # Scrub all of the reports up front, as a separate (CPU bound) stage,
+    # rather than one at a time as they are copied
+    if scrub:
+        paths = cf.get_course_paths(config, required=["course_materials"])
+        print("Removing hidden tests before copying")
+        scrub_feedback_files(
+            Path(paths.materials_dir, "feedback"),
+            assignment_name,
+            students=students,
+        )
+
+    # Each pending future maps to the student and the stage it is running;
+    # when a stage finishes we hand the student on to the next one.
+    failures = {}
+    copy_pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+    commit_pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+    push_pool = ThreadPoolExecutor(max_workers=max(1, push_jobs))
+    try:
+        pending = {}
+        for student in students:
+            future = copy_pool.submit(
+                copy_student_feedback,
+                config,
+                student,
+                assignment_name,
+                repo_index,
+            )
+            pending[future] = (student, "copy", None)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                student, stage, destination_dir = pending.pop(future)
+                try:
+                    result = future.result()
+                except (RuntimeError, OSError) as err:
+                    failures[student] = (stage, err)
+                    continue
+
+                if stage == "copy" and result is not None:
+                    next_future = commit_pool.submit(
+                        github.commit_all_changes,
+                        result,
+                        msg=commit_message,
+                    )
+                    pending[next_future] = (student, "commit", result)
+                elif stage == "commit" and push_to_github:
+                    next_future = push_pool.submit(
+                        github.push_to_github, destination_dir
+                    )
+                    pending[next_future] = (student, "push", destination_dir)
+    finally:
+        for pool in (copy_pool, commit_pool, push_pool):
+            pool.shutdown()
+
+    if failures:
+        # Report in roster order so the summary is the same on every run
+        print("Could not deliver feedback for the following students:")
+        for student in students:
+            if student in failures:
+                stage, err = failures[student]
+                print(" {} ({} failed): {}".format(student, stage, err))
 
 
 def copy_feedback(args):
@@ -127,6 +358,16 @@ def copy_feedback(args):
     scrub : boolean (default = False)
         If true (exists), remove hidden tests from the html output
         before moving it to the student directory
+    jobs : int (default = 1)
+        Number of students to copy and commit feedback for at the same time
+    push_jobs : int (default = 4)
+        Number of pushes to GitHub to run at the same time
+    student : list of strings (optional)
+        Only deliver feedback to these students
+    students_file : string (optional)
+        File listing the students to deliver feedback to, one per line
+    since : datetime (optional)
+        Only deliver feedback to students who pushed to their repo since
 
     Returns
     -------
@@ -138,4 +379,12 @@ def copy_feedback(args):
     push_to_github = args.github
     scrub = args.scrub
 
-    copy_feedback_files(assignment_name, push_to_github, scrub)
+    copy_feedback_files(
+        assignment_name,
+        push_to_github,
+        scrub,
+        args.jobs,
+        args.push_jobs,
+        selected_students=students_from_args(args),
+        since=args.since,
+    )
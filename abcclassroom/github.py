@@ -10,10 +10,23 @@ import random
 import string
 import subprocess
 import sys
+import threading
 
 import github3 as gh3
 
-from .utils import input_editor
+from . import config as cf
+from .utils import input_editor, parse_timestamp
+
+# Files checked out when cloning student repos with sparse=True. Feedback
+# reports are html files that get committed to the student repos, so they
+# need to be inside the sparse checkout too.
+SPARSE_CHECKOUT_PATTERNS = ["*.ipynb", "*.html"]
+
+# Logged-in github3 objects, keyed by token. Each holds a requests session,
+# so sharing them means we reuse open connections to the API rather than
+# doing a new login and TLS handshake for every call.
+_sessions = {}
+_sessions_lock = threading.Lock()
 
 
 def _call_git(*args, directory=None):
@@ -36,11 +49,30 @@ def _call_git(*args, directory=None):
     return ret
 
 
+def get_github_session(token=None):
+    """Get the logged-in GitHub API object for `token`, creating it the first
+    time it is requested. If token is None, uses the token from
+    ``config.get_github_auth()``. All of the API helpers in this module use
+    this, so a process only logs in once per token.
+
+    Returns None if there is no token (same as ``github3.login``).
+    """
+    if token is None:
+        token = cf.get_github_auth().get("token")
+    with _sessions_lock:
+        session = _sessions.get(token)
+        if session is None:
+            session = gh3.login(token=token)
+            if session is not None:
+                _sessions[token] = session
+    return session
+
+
 def remote_repo_exists(org, repository, token=None):
     """Check if the remote repository exists for the organization."""
 
     try:
-        g = gh3.login(token=token)
+        g = get_github_session(token)
         g.repository(org, repository)
 
     except Exception:
@@ -63,7 +95,7 @@ def check_student_repo_exists(org, course, student, token=None):
     gh3_log.setLevel("ERROR")
 
     try:
-        g = gh3.login(token=token)
+        g = get_github_session(token)
         repository = "{}-{}".format(course, student)
         g.repository(org, repository)
 
@@ -74,23 +106,189 @@ def check_student_repo_exists(org, course, student, token=None):
         gh3_log.setLevel(old_level)
 
 
-def clone_repo(organization, repo, dest_dir):
+def get_repo_index(org, token=None):
+    """List all of the repositories in the organization with a single
+    (paged) API query, rather than one request per repository.
+
+    Parameters
+    ----------
+    org : string
+        Name of the GitHub organization.
+    token : string
+        GitHub API token, created by running ``abc-init``.
+
+    Returns
+    -------
+    dict or None
+        Repository objects keyed by lower-case repository name (GitHub repo
+        names are case insensitive), so use ``repo.lower() in index`` to
+        check whether a repo exists. Returns None if the organization could
+        not be listed (e.g. no token), in which case callers should fall back
+        to trying each repository.
+    """
+    try:
+        g = get_github_session(token)
+        organization = g.organization(org)
+        # github3 follows the pagination links for us, 100 repos per request
+        return {
+            repo.name.lower(): repo for repo in organization.repositories()
+        }
+
+    except Exception:
+        return None
+
+
+def get_pushed_at(repo):
+    """When `repo` (from ``get_repo_index``) was last pushed to, as a
+    timezone aware datetime, or None if it never was. The organization
+    listing has this for every repo, so no extra API requests are made."""
+    pushed_at = getattr(repo, "pushed_at", None)
+    if pushed_at is None and hasattr(repo, "as_dict"):
+        # github3 doesn't parse pushed_at for repos in a listing
+        pushed_at = repo.as_dict().get("pushed_at")
+    if isinstance(pushed_at, str):
+        pushed_at = parse_timestamp(pushed_at)
+    return pushed_at
+
+
+def get_repo_url(organization, repo):
+    """Get the ssh URL used to clone `repo` from `organization`."""
+    return "git@github.com:{}/{}.git".format(organization, repo)
+
+
+# git settings for the repo mirrors. Working copies borrow objects from
+# the mirror, so git must never garbage collect it: after a force push, an
+# automatic gc during ``git fetch`` could prune objects that only a working
+# copy still uses, corrupting that working copy.
+MIRROR_GIT_CONFIG = [
+    ("gc.auto", "0"),
+    ("gc.pruneExpire", "never"),
+    ("maintenance.auto", "false"),
+]
+
+
+def update_mirror(organization, repo, cache_dir):
+    """Create or update a local bare mirror of `repo` in `cache_dir`. The
+    first call clones the repo with ``git clone --mirror``; later calls only
+    fetch new commits. Working copies cloned with the mirror as a reference
+    (see ``clone_repo``) borrow its objects rather than downloading them
+    again, so garbage collection is turned off in the mirror (see
+    ``MIRROR_GIT_CONFIG``) before each fetch.
+
+    Returns the path to the mirror.
+    """
+    mirror = os.path.join(cache_dir, organization, repo + ".git")
+    if os.path.isdir(mirror):
+        # also covers mirrors created before gc was turned off
+        _configure_mirror(mirror)
+        _call_git("fetch", "--prune", "origin", directory=mirror)
+    else:
+        os.makedirs(os.path.dirname(mirror), exist_ok=True)
+        _call_git(
+            "clone", "--mirror", get_repo_url(organization, repo), mirror
+        )
+        _configure_mirror(mirror)
+    return mirror
+
+
+def _configure_mirror(mirror):
+    """Apply ``MIRROR_GIT_CONFIG`` to the mirror repo."""
+    for key, value in MIRROR_GIT_CONFIG:
+        _call_git("config", key, value, directory=mirror)
+
+
+def clone_repo(
+    organization,
+    repo,
+    dest_dir,
+    depth=None,
+    blobless=False,
+    sparse=False,
+    reference=None,
+):
     """Clone `repository` from `org` into a sub-directory in `directory`.
     Assumes you have ssh keys setup for github (rather than using GitHub API
-    token)."""
+    token).
+
+    Parameters
+    ----------
+    organization : string
+        Organization where your GitHub classroom lives.
+    repo : string
+        Name of the repository to clone.
+    dest_dir : string
+        Directory to clone the repository into.
+    depth : int (optional)
+        Only fetch the last `depth` commits (``git clone --depth``).
+    blobless : boolean (default = False)
+        Only download file contents as they are checked out
+        (``git clone --filter=blob:none``).
+    sparse : boolean (default = False)
+        Only check out the files that match ``SPARSE_CHECKOUT_PATTERNS``
+        (notebooks and html feedback reports).
+    reference : string (optional)
+        Path to a local mirror of the repo (see ``update_mirror``). Objects
+        in the mirror are used instead of downloading them, and stay there
+        (so don't delete the mirror while the clone is in use).
+        ``update_mirror`` turns off garbage collection in the mirror, so
+        fetching into it never prunes objects the clone still needs.
+    """
     # If ssh  it not setup correctly -  or however we want to authenticate,
     # we need a
     # friendly message about that
     # We should add some message about what is being cloned here - the  url
     # works
-    url = "git@github.com:{}/{}.git".format(organization, repo)
+    url = get_repo_url(organization, repo)
     print("cloning:", url)
-    _call_git("-C", dest_dir, "clone", url)
+    clone_args = ["-C", dest_dir, "clone"]
+    if depth is not None:
+        clone_args.extend(["--depth", str(depth)])
+    if blobless:
+        clone_args.append("--filter=blob:none")
+    if sparse:
+        # set up the sparse checkout before we check out any files
+        clone_args.append("--no-checkout")
+    if reference is not None:
+        clone_args.extend(["--reference", reference])
+    clone_args.extend([url, repo])
+    _call_git(*clone_args)
+
+    if sparse:
+        repo_dir = os.path.join(dest_dir, repo)
+        _call_git(
+            "sparse-checkout",
+            "set",
+            "--no-cone",
+            *SPARSE_CHECKOUT_PATTERNS,
+            directory=repo_dir,
+        )
+        _call_git("checkout", "HEAD", directory=repo_dir)
+
+
+def get_remote_head(organization, repo):
+    """Get the commit SHA that HEAD points to in the remote repo, without
+    fetching anything (uses ``git ls-remote``). Returns None if the remote
+    repo is empty."""
+    ret = _call_git("ls-remote", get_repo_url(organization, repo), "HEAD")
+    output = ret.stdout.decode("utf-8").split()
+    if not output:
+        return None
+    return output[0]
 
 
-def create_repo(org, repository, token):
+def get_fetched_head(directory):
+    """Get the commit SHA of the remote branch that the local repo in
+    `directory` tracks, as of the last clone or pull. Unlike the local HEAD,
+    this matches ``get_remote_head`` when there are no new commits on the
+    remote, even if there are local commits (e.g. feedback) that have not
+    been pushed."""
+    ret = _call_git("rev-parse", "@{upstream}", directory=directory)
+    return ret.stdout.decode("utf-8").strip()
+
+
+def create_repo(org, repository, token=None):
     """Create a repository in the provided GitHub organization."""
-    github_obj = gh3.login(token=token)
+    github_obj = get_github_session(token)
     organization = github_obj.organization(org)
     print(
         "Creating new repository {} at https://github.com/{}".format(
@@ -162,21 +360,27 @@ def commit_all_changes(directory, msg=None):
         print("No changes in repository {}; doing nothing".format(directory))
 
 
-def init_and_commit(directory, custom_message=False):
+def init_and_commit(directory, custom_message=False, message=None):
     """Run git init, git add, git commit on given directory. Checks git status
-    first and does nothing if no changes.
+    first and does nothing if no changes. The commit message is `message` if
+    given (either a string, or a function that returns one, which is only
+    called if there are changes), otherwise it is asked for in the git editor
+    if custom_message is True, and is 'Initial commit' if not.
     """
     # local git things - initialize, add, commit
     # note that running git init on an existing repo is safe, so no need
     # to check anything first
     git_init(directory)
     if repo_changed(directory):
-        message = "Initial commit"
-        if custom_message:
-            message = get_commit_message()
-            if not message:
-                print("Empty commit message, exiting.")
-                sys.exit(1)  # sys is undefined - ask karen about this
+        if callable(message):
+            message = message()
+        if message is None:
+            message = "Initial commit"
+            if custom_message:
+                message = get_commit_message()
+                if not message:
+                    print("Empty commit message, exiting.")
+                    sys.exit(1)  # sys is undefined - ask karen about this
         commit_all_changes(directory, message)
     else:
         print("No changes to local repository.")
@@ -193,7 +397,11 @@ def push_to_github(directory, branch="master"):
 
 
 def pull_from_github(directory, branch="master"):
-    """Pull `branch` of local repo in `directory` from GitHub"""
+    """Pull `branch` of local repo in `directory` from GitHub. This also
+    works for shallow and partial clones: only the commits made since the
+    last fetch are downloaded. (Don't pass ``--depth`` to the pull; the
+    truncated history would make the local feedback commits look unrelated
+    to the new commits.)"""
     try:
         _call_git("pull", "origin", branch, directory=directory)
     except RuntimeError as e:
@@ -220,7 +428,7 @@ def close_existing_pullrequests(
     a branch starting with `branch_base` as name and created by the user
     we are logged in we close them.
     """
-    g = gh3.login(token=token)
+    g = get_github_session(token)
     me = g.me()
     repo = g.repository(org, repository)
     for pr in repo.pull_requests(state="open"):
@@ -234,7 +442,7 @@ def close_existing_pullrequests(
             pr.close()
 
 
-def create_pr(org, repository, branch, message, token):
+def create_pr(org, repository, branch, message, token=None):
     """Create a Pull Request with changes from branch"""
     msg_parts = message.split("\n\n")
     if len(msg_parts) == 1:
@@ -243,15 +451,18 @@ def create_pr(org, repository, branch, message, token):
         title = msg_parts[0]
         msg = "\n\n".join(msg_parts[1:])
 
-    g = gh3.login(token=token)
+    g = get_github_session(token)
     repo = g.repository(org, repository)
     repo.create_pull(title, "master", branch, msg)
 
 
-def fetch_student(org, course, student, directory, token=None):
+def fetch_student(org, course, student, directory, token=None, reference=None):
     """Fetch course repository for `student` from `org`
 
-    The repository will be cloned into a sub-directory in `directory`.
+    The repository will be cloned into a sub-directory in `directory`. If
+    `reference` is the path to a local mirror of the repository (see
+    ``update_mirror``), objects are borrowed from it instead of being
+    downloaded again.
 
     Returns the directory in which to find the students work.
     """
@@ -270,6 +481,8 @@ def fetch_student(org, course, student, directory, token=None):
                 token, org, course, student
             ),
         ]
+    if reference is not None:
+        fetch_command.extend(["--reference", reference])
     subprocess.run(
         fetch_command,
         cwd=directory,
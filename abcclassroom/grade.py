@@ -0,0 +1,142 @@
+"""
+abc-classroom.grade
+===================
+
+Grade many notebooks at once, spread across a pool of processes.
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import ok
+from .utils import copytree
+
+# One row of the grading table. status is one of "graded", "timeout",
+# "check-redefined" (the notebook defines its own `check`, so it is not run)
+# or "error".
+GradeResult = namedtuple(
+    "GradeResult",
+    ["notebook", "status", "points", "max_points", "seconds", "error"],
+)
+
+
+def grade_notebooks(notebook_paths, jobs=None, timeout=None, isolate=True):
+    """Grade a list of notebooks in parallel.
+
+    Each notebook is executed (see ``ok.grade_notebook``) in a separate
+    worker process, so a class worth of notebooks scales with the number of
+    cores on the machine.
+
+    Parameters
+    ----------
+    notebook_paths : list of strings
+        Paths to the notebooks to grade.
+    jobs : int (optional)
+        Number of notebooks to grade at the same time. Defaults to the number
+        of CPUs on this machine.
+    timeout : int (optional)
+        Maximum number of seconds each notebook may run, in total. A
+        notebook that runs longer is stopped and reported with status
+        "timeout".
+    isolate : boolean (default = True)
+        Run each notebook in a temporary copy of its directory (the
+        notebook plus the other files in it, but no other notebooks), so
+        that notebooks sharing a directory can't see or overwrite each
+        other's output files. The executed ``-graded.ipynb`` notebook is
+        copied back next to the original.
+
+    Returns
+    -------
+    list of GradeResult
+        One row per notebook, in the same order as `notebook_paths`.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(_grade_one, path, timeout, isolate)
+            for path in notebook_paths
+        ]
+        return [future.result() for future in futures]
+
+
+def _grade_one(nb_path, timeout, isolate):
+    """Grade a single notebook and summarize the result as a GradeResult.
+    Runs in a worker process; never raises."""
+    start = time.perf_counter()
+    status = "graded"
+    points = max_points = 0
+    error = ""
+    try:
+        if isolate:
+            results = _grade_isolated(nb_path, timeout)
+        else:
+            results = ok.grade_notebook(nb_path, timeout=timeout)
+        if results is None:
+            status = "check-redefined"
+        else:
+            for result in results:
+                # grade_notebook can also report a bare 1.0 for a full grade
+                if isinstance(result, tuple):
+                    points += result[0]
+                    max_points += result[1]
+    except TimeoutError as e:
+        status = "timeout"
+        # the rest of the message is a preview of the cell source
+        error = str(e).splitlines()[0]
+    except Exception as e:
+        status = "error"
+        error = "{}: {}".format(type(e).__name__, e)
+
+    return GradeResult(
+        nb_path,
+        status,
+        points,
+        max_points,
+        round(time.perf_counter() - start, 2),
+        error,
+    )
+
+
+def _ignore_notebooks(directory, names):
+    """``copytree`` ignore function that skips notebooks (and their
+    checkpoints), so a notebook's working copy only gets the support files
+    from its directory, not the other notebooks and their graded output."""
+    return [
+        name
+        for name in names
+        if name.endswith(".ipynb") or name == ".ipynb_checkpoints"
+    ]
+
+
+def _grade_isolated(nb_path, timeout):
+    """Grade a notebook in a temporary copy of its directory (without the
+    other notebooks in it) and copy the graded notebook back next to the
+    original."""
+    nb_directory, nb_name = os.path.split(os.path.abspath(nb_path))
+    graded_name = os.path.splitext(nb_name)[0] + "-graded.ipynb"
+    with tempfile.TemporaryDirectory() as workdir:
+        copytree(nb_directory, workdir, ignore=_ignore_notebooks)
+        shutil.copy(nb_path, os.path.join(workdir, nb_name))
+        results = ok.grade_notebook(
+            os.path.join(workdir, nb_name), timeout=timeout
+        )
+        graded_nb_path = os.path.join(workdir, graded_name)
+        if os.path.exists(graded_nb_path):
+            shutil.copy(
+                graded_nb_path, os.path.join(nb_directory, graded_name)
+            )
+    return results
+
+
+def write_grade_table(results, path):
+    """Write a list of GradeResult rows to a csv file at `path`."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(GradeResult._fields)
+        writer.writerows(results)
@@ -6,6 +6,8 @@ abc-classroom.notebook
 
 import ast
 import os
+import shutil
+import time
 
 import nbformat
 import papermill as pm
@@ -21,9 +23,9 @@ except ImportError:
     raise ImportError("IPython needs to be installed for notebook grading")
 
 
-def normalize_kernel_name(notebook):
-    nb = nbformat.read(notebook, as_version=4)
-
+def _normalize_kernelspec(nb):
+    """Replace a conda environment kernelspec in the notebook object `nb`
+    with the generic python kernel. Returns True if it was changed."""
     kernelspec = nb.metadata.kernelspec
     if "[conda env:" in kernelspec.display_name:
         if kernelspec.language == "python":
@@ -33,38 +35,75 @@ def normalize_kernel_name(notebook):
             else:
                 kernelspec.name = "python2"
                 kernelspec.display_name = "Python 2"
+        return True
+    return False
 
+
+def normalize_kernel_name(notebook):
+    nb = nbformat.read(notebook, as_version=4)
+
+    if _normalize_kernelspec(nb):
         nbformat.write(nb, notebook)
 
 
 def split_notebook(notebook, student_path, autograder_path):
-    """Split a master notebook into student and autograder notebooks"""
+    """Split a master notebook into student and autograder notebooks
+
+    The master notebook is read once and everything is done in memory:
+    the private tests are written to `autograder_path`, the public tests
+    to `student_path` (and copied to `autograder_path`), and the student
+    notebook, with its kernelspec normalized, to `student_path`.
+    """
     print("Processing", notebook)
 
     _, nb_name = os.path.split(notebook)
     base_name, extension = os.path.splitext(nb_name)
 
-    # create test files and notebook for the student
-    nb = NotebookCleaner(notebook)
+    nb = NotebookCleaner(nbformat.read(notebook, as_version=4))
+    # create test files for the autograder and the student
     nb.create_tests(
         tag="private", oktest_path=base_name, base_dir=autograder_path
     )
     nb.create_tests(tag="public", oktest_path=base_name, base_dir=student_path)
+
+    # the autograder also needs the public tests. Each converted cell now
+    # calls `check()` on its test file, so copy those across rather than
+    # converting the cells a second time.
+    os.makedirs(os.path.join(autograder_path, base_name), exist_ok=True)
+    for cell in nb.ntbk.cells:
+        tags = cell.metadata.get("tags", [])
+        if cell.cell_type == "code" and "public" in tags:
+            for oktest in _check_paths(cell.source):
+                shutil.copyfile(
+                    os.path.join(student_path, oktest),
+                    os.path.join(autograder_path, oktest),
+                )
+
+    # create the notebook for the student
     text_replace_begin = "### BEGIN SOLUTION"
     text_replace_end = "### END SOLUTION"
     nb.replace_text(text_replace_begin, text_replace_end)
-
+    _normalize_kernelspec(nb.ntbk)
     nb.save(os.path.join(student_path, nb_name))
-    normalize_kernel_name(os.path.join(student_path, nb_name))
 
-    # create test files for the autograder
-    nb = NotebookCleaner(notebook)
-    nb.create_tests(
-        tag="private", oktest_path=base_name, base_dir=autograder_path
-    )
-    nb.create_tests(
-        tag="public", oktest_path=base_name, base_dir=autograder_path
-    )
+
+def _check_paths(source):
+    """The test file paths passed to `check()` in the source of a cell, e.g.
+    ``['hw1/q-<hash>.py']`` for ``check("hw1/q-<hash>.py")``."""
+    paths = []
+    for node in ast.walk(ast.parse(source)):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == "check"
+            and node.args
+        ):
+            try:
+                paths.append(ast.literal_eval(node.args[0]))
+            except ValueError:
+                # not a plain string, so not a test file nbclean wrote
+                continue
+    return paths
 
 
 def find_check_definition(tree):
@@ -80,6 +119,22 @@ def find_check_definition(tree):
     return False
 
 
+def _target_names(target):
+    """Names bound by an assignment target, including the elements of tuple
+    and list targets like ``a, (b, *c) = ...``"""
+    if isinstance(target, ast.Name):
+        return [target.id]
+    if isinstance(target, ast.Starred):
+        return _target_names(target.value)
+    if isinstance(target, (ast.Tuple, ast.List)):
+        names = []
+        for element in target.elts:
+            names += _target_names(element)
+        return names
+    # attributes and subscripts don't bind a name
+    return []
+
+
 def find_check_assignment(tree):
     """Walk an AST and check for assignments to a variable called `check`
 
@@ -91,41 +146,140 @@ def find_check_assignment(tree):
         # check id for tuple target
         target_names = []
         for target in stmt.targets:
-            if isinstance(target, tuple):
-                target_names += [t.id for t in target]
-            else:
-                target_names.append(target.id)
+            target_names += _target_names(target)
         if "check" in target_names:
             return True
     return False
 
 
-def execute_notebook(nb_path):
-    """Execute a notebook under grading conditions"""
-    graded_nb_path = os.path.splitext(nb_path)[0] + "-graded.ipynb"
-    nb_directory = os.path.split(nb_path)[0]
+# Statements (and expressions) that bind the names in their `target`.
+# ast.NamedExpr (the := operator) only exists on python 3.8 and later.
+_SINGLE_TARGET_NODES = (
+    ast.AnnAssign,
+    ast.AugAssign,
+    ast.For,
+    ast.AsyncFor,
+) + ((ast.NamedExpr,) if hasattr(ast, "NamedExpr") else ())
 
-    # read in input notebook and check the source for shenanigans
-    nb = nbformat.read(nb_path, as_version=4)
-    source = ""
+
+def _binds_check(node):
+    """Does this AST node bind the name `check`?"""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.name == "check"
+    if isinstance(node, ast.Import):
+        # import check, import x as check
+        return any(
+            (alias.asname or alias.name) == "check" for alias in node.names
+        )
+    if isinstance(node, ast.ImportFrom):
+        # from x import y as check. A plain `from x import check` is how
+        # notebooks get the grading `check` in the first place, so allow it
+        return any(alias.asname == "check" for alias in node.names)
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, _SINGLE_TARGET_NODES):
+        targets = [node.target]
+    elif isinstance(node, ast.withitem):
+        targets = [node.optional_vars]
+    else:
+        return False
+    return any(
+        "check" in _target_names(target)
+        for target in targets
+        if target is not None
+    )
+
+
+def find_check_redefinition(tree):
+    """Walk an AST and check for anything that defines, assigns or imports a
+    name called `check`. This does the work of ``find_check_definition``
+    and ``find_check_assignment`` (and also catches imports) in a single
+    pass that stops at the first one found. ``from x import check`` is
+    allowed, as that is how notebooks import the grading `check`.
+
+    Return True if one is found, False otherwise.
+    """
+    return any(_binds_check(node) for node in ast.walk(tree))
+
+
+def notebook_redefines_check(nb):
+    """Check the code cells of the notebook object `nb` for a redefinition
+    of `check` (see ``find_check_redefinition``).
+
+    Each cell is parsed separately, so no source for the whole notebook is
+    built up in memory. Only cells that aren't plain Python are run through
+    the IPython transformer (for magics, shell commands and so on). Cells
+    that are not valid Python even then are skipped, as they can't define
+    anything when the notebook is run either.
+
+    Return True as soon as a cell redefining `check` is found, False
+    otherwise.
+    """
+    isp = IPythonInputSplitter(line_input_checker=False)
     for cell in nb.cells:
         if cell.cell_type != "code":
             continue
+        try:
+            tree = ast.parse(cell.source)
+        except SyntaxError:
+            try:
+                tree = ast.parse(isp.transform_cell(cell.source))
+            except SyntaxError:
+                continue
+        if find_check_redefinition(tree):
+            return True
+    return False
+
+
+def _time_left(timeout):
+    """Make a ``timeout_func`` for the notebook client that gives each cell
+    the time that is left of `timeout` seconds, counted from when the first
+    cell starts. Raises TimeoutError once there is no time left."""
+    deadline = []
+
+    def time_left(cell):
+        if not deadline:
+            deadline.append(time.monotonic() + timeout)
+        left = deadline[0] - time.monotonic()
+        if left <= 0:
+            raise TimeoutError(
+                "Notebook ran for more than {} seconds".format(timeout)
+            )
+        return left
 
-        isp = IPythonInputSplitter(line_input_checker=False)
-        cell_source = isp.transform_cell(cell.source)
-        source += cell_source
+    return time_left
 
-    tree = ast.parse(source)
+
+def execute_notebook(nb_path, timeout=None):
+    """Execute a notebook under grading conditions
+
+    Returns the executed notebook, or None if the notebook defines its own
+    `check` function. If `timeout` is given, the cells of the notebook may
+    run for at most `timeout` seconds in total (starting the kernel has its
+    own timeout in papermill). When the time runs out the running cell is
+    stopped, the kernel is shut down and a ``TimeoutError`` is raised.
+    """
+    graded_nb_path = os.path.splitext(nb_path)[0] + "-graded.ipynb"
+    nb_directory = os.path.split(nb_path)[0]
+
+    # read in input notebook and check the source for shenanigans
+    nb = nbformat.read(nb_path, as_version=4)
 
     # no points for you if you try and cheat
-    # XXX add a check for people importing a function called `check`
-    if find_check_assignment(tree) or find_check_definition(tree):
+    if notebook_redefines_check(nb):
         return
 
+    # papermill only has a per-cell timeout, so give each cell whatever is
+    # left of the time for the whole notebook
+    engine_kwargs = {}
+    if timeout is not None:
+        engine_kwargs["timeout_func"] = _time_left(timeout)
+
     # run the notebook
     with chdir(nb_directory):
-        pm.execute_notebook(nb_path, graded_nb_path)
+        pm.execute_notebook(
+            nb_path, graded_nb_path, progress_bar=False, **engine_kwargs
+        )
 
     graded_nb = nbformat.read(graded_nb_path, as_version=4)
     return graded_nb
@@ -19,37 +19,77 @@ from pygments import highlight
 from pygments.lexers import PythonConsoleLexer
 from pygments.formatters import HtmlFormatter
 
+# MIME type of the machine readable results that OKSuiteResult adds to the
+# display output of `check()`, next to the html. grade_notebook reads these
+# directly instead of parsing the html.
+RESULT_MIME_TYPE = "application/vnd.abcclassroom.grade+json"
 
-def run_doctest(name, doctest_string, global_environment):
+# Parsed OK test files, keyed by absolute path. Each value is the
+# (mtime, size) of the file when it was parsed plus the parsed tests and
+# doctest examples, so that repeated `check()` calls against the same file
+# don't re-read, exec and parse it.
+_test_file_cache = {}
+
+_doctest_parser = doctest.DocTestParser()
+
+# Shared pygments objects for highlighting the code of failed tests. These
+# are only used when a result is displayed as html.
+_console_lexer = PythonConsoleLexer()
+_html_formatter = HtmlFormatter(noclasses=True)
+
+
+def run_doctests(cases, global_environment):
+    """
+    Run several tests with given global_environment.
+    cases is a list of (name, doctest_string, examples) tuples, where
+    examples is the list of already parsed doctest examples or None.
+    All cases run with a single DocTestRunner inside one hide_outputs
+    scope, rather than setting these up again for every case. The output
+    of each case is captured in its own StringIO.
+    Returns a list with a (passed, failure_message) tuple for each case,
+    the same as run_doctest.
+    """
+    doctestrunner = doctest.DocTestRunner(verbose=True)
+    results = []
+    with hide_outputs():
+        for name, doctest_string, examples in cases:
+            if examples is None:
+                examples = _doctest_parser.get_examples(doctest_string, name)
+            test = doctest.DocTest(
+                examples,
+                global_environment,
+                name,
+                None,
+                None,
+                doctest_string,
+            )
+            # each case gets its own real text stream, so tests that look
+            # at sys.stderr (isatty, encoding, ...) behave as they would
+            # outside of the batch
+            runresults = io.StringIO()
+            with redirect_stdout(runresults), redirect_stderr(runresults):
+                result = doctestrunner.run(
+                    test, out=runresults.write, clear_globs=False
+                )
+            # An individual test can only pass or fail
+            if result.failed == 0:
+                results.append((True, ""))
+            else:
+                results.append((False, runresults.getvalue()))
+    return results
+
+
+def run_doctest(name, doctest_string, global_environment, examples=None):
     """
     Run a single test with given global_environment.
     Returns (True, '') if the doctest passes.
     Returns (False, failure_message) if the doctest fails.
+    If the list of doctest examples in doctest_string has already been
+    parsed, pass it as examples to skip parsing it again.
     """
-    examples = doctest.DocTestParser().parse(doctest_string, name)
-    test = doctest.DocTest(
-        [e for e in examples if isinstance(e, doctest.Example)],
-        global_environment,
-        name,
-        None,
-        None,
-        doctest_string,
-    )
-
-    doctestrunner = doctest.DocTestRunner(verbose=True)
-
-    runresults = io.StringIO()
-    with redirect_stdout(runresults), redirect_stderr(
-        runresults
-    ), hide_outputs():
-        doctestrunner.run(test, clear_globs=False)
-    with open("/dev/null", "w") as f, redirect_stderr(f), redirect_stdout(f):
-        result = doctestrunner.summarize(verbose=True)
-    # An individual test can only pass or fail
-    if result.failed == 0:
-        return (True, "")
-    else:
-        return False, runresults.getvalue()
+    return run_doctests(
+        [(name, doctest_string, examples)], global_environment
+    )[0]
 
 
 class OKTest:
@@ -77,50 +117,70 @@ class OKTest:
     """
     )
 
-    def __init__(self, name, tests):
+    def __init__(self, name, tests, examples=None):
         """
-        tests is list of doctests that should be run.
+        tests is list of doctests that should be run. examples is the list
+        of parsed doctest examples for each test (parsed from tests if not
+        given).
         """
         self.name = name
         self.tests = tests
+        if examples is None:
+            examples = [
+                _doctest_parser.get_examples(test, name)
+                for _, test in tests
+            ]
+        self.examples = examples
+
+    def cases(self):
+        """
+        The (name, doctest_string, examples) of each test case, as taken by
+        run_doctests.
+        """
+        return [
+            ("{} test #{}".format(self.name, i + 1), test, self.examples[i])
+            for i, (_, test) in enumerate(self.tests)
+        ]
 
-    def run(self, global_environment):
+    def results(self, outcomes):
+        """
+        Make an OKTestCaseResult for each test case from the list of
+        (passed, failure_message) outcomes returned by run_doctests.
+        """
         results = []
-        for i, (max_points, test) in enumerate(self.tests):
-            name = "{} test #{}".format(self.name, i + 1)
-            passed, result = run_doctest(name, test, global_environment)
-            if not passed:
-                results.append(
-                    (
-                        False,
-                        (0, max_points),
-                        OKTest.result_fail_template.render(
-                            name=name,
-                            test_code=highlight(
-                                test,
-                                PythonConsoleLexer(),
-                                HtmlFormatter(noclasses=True),
-                            ),
-                            test_result=result,
-                        ),
-                    )
-                )
-            else:
-                results.append(
-                    (
-                        True,
-                        (max_points, max_points),
-                        OKTest.result_pass_template.render(name=name),
-                    )
+        for (name, test, _), (max_points, _), (passed, result) in zip(
+            self.cases(), self.tests, outcomes
+        ):
+            results.append(
+                OKTestCaseResult(
+                    name,
+                    passed,
+                    max_points if passed else 0,
+                    max_points,
+                    test,
+                    result,
                 )
-
+            )
         return results
 
+    def run(self, global_environment):
+        return self.results(run_doctests(self.cases(), global_environment))
+
     @classmethod
     def from_file(cls, path):
         """
         Parse a ok test file & return an OKTest
+
+        Parsed files are cached, and only re-parsed if their modification
+        time or size changes.
         """
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = _test_file_cache.get(os.path.abspath(path))
+        if cached is not None and cached[0] == signature:
+            _, tests, examples = cached
+            return cls(path, tests, examples)
+
         # ok test files are python files, with a global 'test' defined
         test_globals = {}
         with open(path) as f:
@@ -153,7 +213,49 @@ class OKTest:
         for i, test_case in enumerate(test_spec["suites"][0]["cases"]):
             tests.append((int(test_case["points"]), dedent(test_case["code"])))
 
-        return cls(path, tests)
+        ok_test = cls(path, tests)
+        _test_file_cache[os.path.abspath(path)] = (
+            signature,
+            ok_test.tests,
+            ok_test.examples,
+        )
+        return ok_test
+
+
+class OKTestCaseResult:
+    """
+    The result of a single test case of an OKTest. The html hint for the
+    case is only rendered when it is displayed, so grading without a
+    display doesn't pay for templating and syntax highlighting.
+    """
+
+    __slots__ = (
+        "name",
+        "passed",
+        "points",
+        "max_points",
+        "test_code",
+        "output",
+    )
+
+    def __init__(self, name, passed, points, max_points, test_code, output):
+        self.name = name
+        self.passed = passed
+        self.points = points
+        self.max_points = max_points
+        self.test_code = test_code
+        self.output = output
+
+    def _repr_html_(self):
+        if self.passed:
+            return OKTest.result_pass_template.render(name=self.name)
+        return OKTest.result_fail_template.render(
+            name=self.name,
+            test_code=highlight(
+                self.test_code, _console_lexer, _html_formatter
+            ),
+            test_result=self.output,
+        )
 
 
 class OKSuite:
@@ -165,14 +267,23 @@ class OKSuite:
         failed_tests = []
         points_scored = 0
         max_total_points = 0
+        # Run the cases of all the tests as one batch, then hand each test
+        # back its share of the outcomes
+        outcomes = run_doctests(
+            [case for t in self.tests for case in t.cases()],
+            global_environment,
+        )
+        start = 0
         for t in self.tests:
-            for passed, points, hint in t.run(global_environment):
-                points_scored += points[0]
-                max_total_points += points[1]
-                if passed:
-                    passed_tests.append(hint)
+            end = start + len(t.tests)
+            for case in t.results(outcomes[start:end]):
+                points_scored += case.points
+                max_total_points += case.max_points
+                if case.passed:
+                    passed_tests.append(case)
                 else:
-                    failed_tests.append(hint)
+                    failed_tests.append(case)
+            start = end
 
         # grade = len(passed_tests) / len(passed_tests + failed_tests)#not used
         return OKSuiteResult(
@@ -185,7 +296,8 @@ class OKSuite:
 
 class OKSuiteResult:
     """
-    Displayable result from running OKTests
+    Displayable result from running OKTests. passed_tests and failed_tests
+    are lists of OKTestCaseResult.
     """
 
     result_template = Template(
@@ -226,18 +338,36 @@ class OKSuiteResult:
         self.tests = passed_tests + failed_tests
         self.include_grade = include_grade
 
+    def to_dict(self):
+        """Summary of the result as a JSON-serializable dictionary"""
+        return {
+            "points": self.grade[0],
+            "max_points": self.grade[1],
+            "passed": len(self.passed_tests),
+            "failed": len(self.failed_tests),
+        }
+
+    def _repr_mimebundle_(self, include=None, exclude=None):
+        # IPython merges this with the output of _repr_html_
+        return {RESULT_MIME_TYPE: self.to_dict()}
+
     def _repr_html_(self):
         return OKSuiteResult.result_template.render(
             grade=self.grade,
-            passed_tests=self.passed_tests,
-            failed_tests=self.failed_tests,
+            passed_tests=[test._repr_html_() for test in self.passed_tests],
+            failed_tests=[test._repr_html_() for test in self.failed_tests],
             tests=self.tests,
             include_grade=self.include_grade,
         )
 
 
-def grade_notebook(notebook_path):
-    executed_nb = execute_notebook(notebook_path)
+def grade_notebook(notebook_path, timeout=None):
+    """Execute a notebook and collect the (scored, total) points from each
+    cell that calls `check()`. Returns None if the notebook was not run
+    because it defines its own `check`."""
+    executed_nb = execute_notebook(notebook_path, timeout=timeout)
+    if executed_nb is None:
+        return None
     # collect marks from each cell containing a `check()` call
     results = []
 
@@ -245,6 +375,18 @@ def grade_notebook(notebook_path):
         if cell.cell_type != "code":
             continue
 
+        structured = [
+            output["data"][RESULT_MIME_TYPE]
+            for output in cell.get("outputs", [])
+            if RESULT_MIME_TYPE in output.get("data", {})
+        ]
+        if structured:
+            for result in structured:
+                results.append((result["points"], result["max_points"]))
+            continue
+
+        # Notebooks run with an older version of `check()` only have the
+        # html output, so fall back to reading the points from that
         if cell.source.startswith("check(") and cell.source.endswith(")"):
             output = cell["outputs"][0]["data"]["text/html"].strip()
             # got all points
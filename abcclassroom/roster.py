@@ -0,0 +1,181 @@
+"""
+abc-classroom.roster
+====================
+
+Read the course roster (the list of students downloaded from GitHub
+classroom) once, and look students up by GitHub username or identifier.
+"""
+
+import csv
+
+from . import github
+
+# Columns the roster must have. GitHub classroom rosters also have
+# github_id and name columns, which are optional here.
+REQUIRED_COLUMNS = ["identifier", "github_username"]
+
+
+class Student:
+    """A single row of the roster."""
+
+    __slots__ = ("identifier", "github_username", "github_id", "name")
+
+    def __init__(self, identifier, github_username, github_id="", name=""):
+        self.identifier = identifier
+        self.github_username = github_username
+        self.github_id = github_id
+        self.name = name
+
+    def __repr__(self):
+        return "Student({!r}, {!r})".format(
+            self.identifier, self.github_username
+        )
+
+
+class Roster:
+    """The students in the course roster, in roster order. Students can be
+    looked up by GitHub username or identifier with ``get``, and a roster
+    can be narrowed down to some students with ``filter``.
+
+    Use ``Roster.from_csv`` to read the roster file.
+    """
+
+    def __init__(self, students):
+        self.students = list(students)
+        self.by_username = {
+            s.github_username: s for s in self.students if s.github_username
+        }
+        self.by_identifier = {s.identifier: s for s in self.students}
+
+    @classmethod
+    def from_csv(cls, path):
+        """Read the roster csv file at path. The header is checked before
+        any rows are read, and surrounding whitespace is stripped from the
+        column names and from each github username.
+
+        Raises FileNotFoundError if there is no roster file, and KeyError if
+        it doesn't have the ``identifier`` and ``github_username`` columns.
+        """
+        with open(path, newline="") as csvfile:
+            reader = csv.DictReader(csvfile)
+            fieldnames = [name.strip() for name in reader.fieldnames or []]
+            missing = [c for c in REQUIRED_COLUMNS if c not in fieldnames]
+            if missing:
+                raise KeyError(
+                    "Oops! Please check your roster file to "
+                    "ensure is has the correct "
+                    "headers. Missing columns: {}".format(", ".join(missing))
+                )
+            reader.fieldnames = fieldnames
+            return cls(
+                Student(
+                    row["identifier"],
+                    (row["github_username"] or "").strip(),
+                    row.get("github_id") or "",
+                    row.get("name") or "",
+                )
+                for row in reader
+            )
+
+    def __iter__(self):
+        return iter(self.students)
+
+    def __len__(self):
+        return len(self.students)
+
+    def get(self, name):
+        """Look up a student by GitHub username or identifier. Returns None
+        if there is no such student."""
+        student = self.by_username.get(name)
+        if student is None:
+            student = self.by_identifier.get(name)
+        return student
+
+    @property
+    def usernames(self):
+        """GitHub usernames of the students that have one, in roster
+        order."""
+        return [s.github_username for s in self.students if s.github_username]
+
+    @property
+    def missing_usernames(self):
+        """Students that don't have a GitHub username in the roster."""
+        return [s for s in self.students if not s.github_username]
+
+    def filter(self, names):
+        """Make a roster with only the students in `names` (GitHub usernames
+        or identifiers), kept in roster order. Names that are not in the
+        roster are reported and ignored.
+        """
+        selected = set()
+        for name in names:
+            student = self.get(name)
+            if student is None:
+                print("Oops! {} is not in the roster; skipping".format(name))
+            else:
+                selected.add(id(student))
+        return Roster(s for s in self.students if id(s) in selected)
+
+    def pushed_since(self, repo_index, assignment_name, since):
+        """Make a roster with only the students whose repo for the
+        assignment was pushed to at or after `since` (a timezone aware
+        datetime), going by the ``pushed_at`` time in `repo_index` (see
+        ``github.get_repo_index``). Students without a repo are left out.
+        """
+        selected = []
+        for student in self.students:
+            if not student.github_username:
+                continue
+            repo_name = "{}-{}".format(
+                assignment_name, student.github_username
+            )
+            repo = repo_index.get(repo_name.lower())
+            if repo is None:
+                continue
+            pushed_at = github.get_pushed_at(repo)
+            if pushed_at is not None and pushed_at >= since:
+                selected.append(student)
+        return Roster(selected)
+
+
+def read_student_list(path):
+    """Read a list of students (GitHub usernames or identifiers), one per
+    line, from the file at path. Blank lines and lines starting with # are
+    ignored."""
+    with open(path) as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+
+def students_from_args(args):
+    """The students selected on the command line with --student and
+    --students-file, or None if neither was used (everyone)."""
+    if args.student is None and args.students_file is None:
+        return None
+    students = list(args.student or [])
+    if args.students_file is not None:
+        students += read_student_list(args.students_file)
+    return students
+
+
+def select_pushed_since(roster, repo_index, assignment_name, since):
+    """Narrow the roster down to the students whose repo for the assignment
+    was pushed to since `since`. If the organization's repos could not be
+    listed, the roster is returned as it is."""
+    if repo_index is None:
+        print(
+            "Oops! I couldn't list the repositories on GitHub, so I can't "
+            "tell which were pushed to since {}. Using all of the selected "
+            "students.".format(since)
+        )
+        return roster
+    pushed = roster.pushed_since(repo_index, assignment_name, since)
+    print(
+        "{} of {} repos were pushed to since {}".format(
+            len(pushed), len(roster), since
+        )
+    )
+    return pushed
@@ -3,12 +3,24 @@ abc-classroom.scrub-feedback
 ============================
 """
 
+import mmap
+import os
 import re
-import codecs
+import stat
+import tempfile
 
 # This approach borrowed
 # from https://github.com/jupyter/nbgrader/issues/1156#issuecomment-502097507
 
+# Matches a block of hidden tests, marked with either ### or (just in case
+# we use just one pound sign) # BEGIN / END HIDDEN TESTS. The back reference
+# makes sure the END marker uses the same number of pound signs as BEGIN.
+_hidden_tests = re.compile(
+    rb'<span class="c1">(###|#) BEGIN HIDDEN TESTS</span>.*?'
+    rb'<span class="c1">\1 END HIDDEN TESTS</span>',
+    re.DOTALL,
+)
+
 
 def scrub_feedback(html_path):
     """Scrub out hidden tests from nbgrader html feedback pages.
@@ -18,8 +30,13 @@ def scrub_feedback(html_path):
     it is more work than expected to generate a nice custom report.
 
     This will remove all html between ### BEGIN HIDDEN TESTS and ### END
-    HIDDEN TESTS. Because I think we sometimes only use one # sign i may add a
-    second catch for this.
+    HIDDEN TESTS (or # BEGIN HIDDEN TESTS and # END HIDDEN TESTS, as we
+    sometimes only use one # sign).
+
+    The file is memory mapped rather than read into memory, as reports with
+    embedded images can be large. It is only rewritten if there were hidden
+    tests to remove, and then atomically (the cleaned html is written to a
+    temporary file that replaces the original).
 
     Parameters
     ----------
@@ -28,37 +45,42 @@ def scrub_feedback(html_path):
 
     Returns
     -------
-    html-file : A cleaned html file without the hidden tests.
-        The original file will be overwritten.
+    removed : int
+        The number of hidden test blocks removed. The original file is
+        overwritten with a cleaned html file without the hidden tests.
     """
-    with codecs.open(html_path, "r") as html_file:
-        orig_html_feedback = html_file.read()
+    # mmap can't map an empty file
+    if os.path.getsize(html_path) == 0:
+        return 0
 
-    # Hide hidden tests
-    html_clean = re.sub(
-        r'<span class="c1">### BEGIN HIDDEN TESTS<\/span>[\w\W]*?'
-        r'<span class="c1">### END HIDDEN TESTS<\/span>',
-        "",
-        orig_html_feedback,
-    )
-    # Just in case we use just one pound sign
-    html_clean = re.sub(
-        r'<span class="c1"># BEGIN HIDDEN TESTS<\/span>[\w\W]*?'
-        r'<span class="c1"># END HIDDEN TESTS<\/span>',
-        "",
-        html_clean,
-    )
+    removed = 0
+    with open(html_path, "rb") as html_file, mmap.mmap(
+        html_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as html:
+        match = _hidden_tests.search(html)
+        if match is None:
+            return 0
 
-    # Not sure we will need this
-    # Hide the traceback (which includes parts of the hidden tests)
-    # html = re.sub(
-    #     r'(<div class="output_subarea output_text output_error">\n<pre>\n)
-    #     (?:(?!<\/div>)[\w\W])*(
-    #     <span class="ansi-red-intense-fg ansi-bold">[\w\W]*?<\/pre>)',
-    #     r'\1\2',
-    #     orig_html_feedback)
+        # Write the file - currently this overwrites the existing html
+        # output. We could consider a different approach
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(html_path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as cleaned_html:
+                start = 0
+                while match is not None:
+                    end = match.start()
+                    cleaned_html.write(html[start:end])
+                    start = match.end()
+                    removed += 1
+                    match = _hidden_tests.search(html, start)
+                cleaned_html.write(html[start:])
+        except BaseException:
+            os.remove(tmp_path)
+            raise
 
-    # Write the file - currently this overwrites the existing html output
-    # We could consider a different approach
-    with open(html_path, "w") as cleaned_html:
-        cleaned_html.write(html_clean)
+    # keep the permissions of the original (mkstemp files are private)
+    os.chmod(tmp_path, stat.S_IMODE(os.stat(html_path).st_mode))
+    os.replace(tmp_path, html_path)
+    return removed
@@ -6,6 +6,9 @@ abc-classroom.template
 import os
 import sys
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 from . import config as cf
@@ -15,13 +18,17 @@ from . import utils
 
 def new_update_template(args):
     """
-    Creates or updates an assignment template repository. Implementation of
+    Creates or updates assignment template repositories. Implementation of
     both the new_template and update_template console scripts (which perform
     the same basic functions but with different command line arguments and
     defaults).
 
-    Creates an assignment entry in the config file if one does not already
-    exist.
+    Several assignments (or all of the assignments in the release
+    directory, with --all) can be built in one run. The config is loaded
+    once, the commit message is asked for at most once (when the first
+    template with changes is committed), and the templates are built in
+    parallel. Creates an assignment entry in the config file for each
+    template that was built, with a single write at the end.
 
     Parameters
     ----------
@@ -31,40 +38,156 @@ def new_update_template(args):
     print("Loading configuration from config.yml")
     config = cf.get_config()
 
-    # create the local directory; copy extra files first, because we use the
-    # .gitignore to filter the assignment files in copy_assignment_files
-    assignment = args.assignment
-    template_repo_path = create_template_dir(config, assignment, args.mode)
-    copy_assignment_files(config, template_repo_path, assignment)
-    create_extra_files(config, template_repo_path, assignment)
+    release_dir = find_release_dir(config)
+    if args.all:
+        requested = sorted(p.name for p in release_dir.iterdir() if p.is_dir())
+    else:
+        requested = list(dict.fromkeys(args.assignment))
+    failures = []
+    assignments = []
+    for assignment in requested:
+        if Path(release_dir, assignment).is_dir():
+            assignments.append(assignment)
+        else:
+            print(
+                "release directory {} does not exist; skipping".format(
+                    Path(release_dir, assignment)
+                )
+            )
+            failures.append((assignment, "no release directory"))
+    if not assignments:
+        print("No assignments to build; exiting")
+        sys.exit(1)
 
-    # create the local git repository and commit changes
-    github.init_and_commit(template_repo_path, args.custom_message)
+    # create the local directories first, one at a time, so that we stop
+    # before doing any work if one already exists in fail mode
+    template_paths = [
+        create_template_dir(config, assignment, args.mode)
+        for assignment in assignments
+    ]
 
-    # create / append assignment entry in config
-    print("Updating assignment list in config")
-    course_dir = cf.get_config_option(config, "course_directory", True)
-    cf.set_config_option(
-        config,
-        "assignments",
-        assignment,
-        append_value=True,
-        configpath=course_dir,
-    )
+    # ask for the commit message once, rather than once per template, and
+    # only when a template actually has changes to commit
+    message = _shared_commit_message(args.custom_message)
 
-    # optional github steps
+    # optional github steps share one session and one listing of the
+    # organization's repos
+    remote = None
     if args.github:
         organization = cf.get_config_option(config, "organization", True)
-        repo_name = os.path.basename(template_repo_path)
         token = cf.get_github_auth()["token"]
+        repo_index = github.get_repo_index(organization, token)
+        remote = (organization, token, repo_index)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [
+            executor.submit(
+                _build_template,
+                config,
+                assignment,
+                template_path,
+                message,
+                remote,
+            )
+            for assignment, template_path in zip(assignments, template_paths)
+        ]
+        for assignment, future in zip(assignments, futures):
+            error = future.result()
+            if error:
+                failures.append((assignment, error))
+
+    # create / append assignment entries in config
+    failed = {assignment for assignment, _ in failures}
+    built = [a for a in assignments if a not in failed]
+    if built:
+        print("Updating assignment list in config")
+        course_dir = cf.get_config_option(config, "course_directory", True)
+        with cf.edit_config(course_dir) as current_config:
+            for assignment in built:
+                cf.update_config_option(
+                    current_config,
+                    "assignments",
+                    assignment,
+                    append_value=True,
+                )
+
+    if len(requested) > 1:
+        print("Built {} of {} templates.".format(len(built), len(requested)))
+    if failures:
+        print("Could not build the following templates:")
+        for assignment, error in failures:
+            print(" {}: {}".format(assignment, error))
+        sys.exit(1)
 
-        create_or_update_remote(
-            template_repo_path, organization, repo_name, token
+
+def find_release_dir(config):
+    """Get the course_materials/release directory, which has a directory of
+    files for each assignment. Exits if it does not exist."""
+    paths = cf.get_course_paths(config, required=["course_materials"])
+    release_dir = Path(paths.materials_dir, "release")
+    if not release_dir.is_dir():
+        print(
+            "release directory {} does not exist; exiting\n".format(
+                release_dir
+            )
         )
+        sys.exit(1)
+    return release_dir
+
+
+def _shared_commit_message(custom_message):
+    """Make a function that returns the commit message for the templates.
+    With custom_message, the message is asked for in the git editor the
+    first time the function is called (the workers wait for each other, so
+    there is only one editor) and reused after that; otherwise it is
+    'Initial commit'. Raises RuntimeError if the message is empty."""
+    lock = threading.Lock()
+    messages = []
+
+    def get_message():
+        with lock:
+            if not messages:
+                message = "Initial commit"
+                if custom_message:
+                    message = github.get_commit_message()
+                    if not message:
+                        print("Empty commit message; not committing.")
+                messages.append(message)
+        if not messages[0]:
+            raise RuntimeError("Empty commit message")
+        return messages[0]
+
+    return get_message
+
+
+def _build_template(config, assignment, template_repo_path, message, remote):
+    """Copy the files into one template repo, commit them and (if remote is
+    an (organization, token, repo_index) tuple) push the repo to GitHub.
+    message is a function that returns the commit message, which is only
+    called if there is something to commit. Runs in a worker thread.
+    Returns an error message, or an empty string on success."""
+    try:
+        # copy extra files first, because we use the .gitignore to filter
+        # the assignment files in copy_assignment_files
+        copy_assignment_files(config, template_repo_path, assignment)
+        create_extra_files(config, template_repo_path, assignment)
+
+        # create the local git repository and commit changes
+        github.init_and_commit(template_repo_path, message=message)
+
+        if remote is not None:
+            organization, token, repo_index = remote
+            repo_name = os.path.basename(template_repo_path)
+            create_or_update_remote(
+                template_repo_path, organization, repo_name, token, repo_index
+            )
+    except (Exception, SystemExit) as e:
+        return "{}: {}".format(type(e).__name__, e)
+    return ""
 
 
 def create_or_update_remote(
-    template_repo_path, organization, repo_name, token
+    template_repo_path, organization, repo_name, token, repo_index=None
 ):
     """
     Push template repo to github creating a new repository or update the
@@ -81,9 +204,18 @@ def create_or_update_remote(
     token : github token
         Used to authenticate with GitHub via the API. Created by running
         ``abc-init``
+    repo_index : dict (optional)
+        Index of the repositories in the organization, as returned by
+        ``github.get_repo_index``. If provided, used to check whether the
+        remote repo exists instead of querying GitHub for this repo.
 
     """
-    remote_exists = github.remote_repo_exists(organization, repo_name, token)
+    if repo_index is not None:
+        remote_exists = repo_name.lower() in repo_index
+    else:
+        remote_exists = github.remote_repo_exists(
+            organization, repo_name, token
+        )
     if not remote_exists:
         print("Creating remote repo {}".format(repo_name))
         # create the remote repo on github and push the local repo
@@ -115,9 +247,9 @@ def create_template_dir(config, assignment, mode="fail"):
     do nothing. If directory exists and mode is delete, remove contents but
     leave .git directory.
     """
-    course_dir = cf.get_config_option(config, "course_directory", True)
-    template_parent_dir = cf.get_config_option(config, "template_dir", True)
-    parent_path = Path(utils.get_abspath(template_parent_dir, course_dir))
+    paths = cf.get_course_paths(config, required=["template_dir"])
+    course_dir = paths.course_dir
+    parent_path = paths.template_dir
 
     # check that parent directory for templates exists, and create it
     # if it does not
@@ -186,8 +318,13 @@ def create_template_dir(config, assignment, mode="fail"):
 
 
 def copy_assignment_files(config, template_repo, assignment):
-    """Copy all of the files from the course_materials/release directory for the
-    assignment into the template repo directory.
+    """Sync the files from the course_materials/release directory for the
+    assignment, including sub-directories, into the template repo directory.
+    Only new and changed files are copied, and files that have been deleted
+    from the release directory are removed from the template repo (except
+    for the .git directory, the extra files and ignored files). Names in
+    ``files_to_ignore`` can be glob patterns, and apply in every
+    sub-directory.
 
     Parameters
     ----------
@@ -200,12 +337,16 @@ def copy_assignment_files(config, template_repo, assignment):
     assignment: string
         name of the assignment being copied
 
+    Returns
+    -------
+    dict
+        The paths of the files that were "added", "updated", "removed" and
+        "unchanged" (see ``utils.sync_tree``).
     """
 
-    course_dir = cf.get_config_option(config, "course_directory", True)
-    materials_dir = cf.get_config_option(config, "course_materials", True)
-    parent_path = utils.get_abspath(materials_dir, course_dir)
-    release_dir = Path(parent_path, "release", assignment)
+    paths = cf.get_course_paths(config, required=["course_materials"])
+    course_dir = paths.course_dir
+    release_dir = Path(paths.materials_dir, "release", assignment)
 
     if not release_dir.is_dir():
         print(
@@ -215,43 +356,54 @@ def copy_assignment_files(config, template_repo, assignment):
         )
         sys.exit(1)
 
-    nfiles = 0
-    all_files = os.listdir(release_dir)
-
     print(
-        "Copying assignment files to {}: ".format(
+        "Syncing assignment files to {}: ".format(
             template_repo.relative_to(course_dir)
         )
     )
-    # TODO this could also use the copy files helper - thinking to put it in
-    # the utils module
-    # Get a list of files to ignore - maybe our default config has some
-    # could have some defaults - then remove all files that we want to ignore
     files_to_ignore = cf.get_config_option(config, "files_to_ignore", True)
-    files_to_move = set(all_files).difference(files_to_ignore)
+    # the extra files are copied in after these, so skip any that are
+    # replaced by an extra file
+    exclude = set(extra_file_names(config))
+    exclude.add(".git")
+    changes = utils.sync_tree(
+        release_dir,
+        template_repo,
+        ignore=files_to_ignore,
+        exclude=exclude,
+        delete=True,
+        sync_function=partial(
+            _sync_template_file,
+            assignment=assignment,
+            template_repo=template_repo,
+        ),
+    )
+    _print_changes(changes)
+    print(
+        "Added {}, updated {} and removed {} files ({} unchanged)".format(
+            len(changes["added"]),
+            len(changes["updated"]),
+            len(changes["removed"]),
+            len(changes["unchanged"]),
+        )
+    )
+    return changes
 
-    for file in files_to_move:
-        fpath = Path(release_dir, file)
-        if fpath.is_dir():
-            # TODO: Note that as written here, moving directories will fail so
-            print(
-                "Oops - looks like {} is a directory. Currently I can't "
-                "move that for you. Contact the abc-classroom maintainers"
-                "if this is a feature that you'd "
-                "like".format(fpath.relative_to(course_dir))
-            )
-        else:
-            print(" {}".format(fpath.relative_to(course_dir)))
-            # Overwrites if fpath exists in template_repo
-            shutil.copy(fpath, template_repo)
-            nfiles += 1
 
-    print("Copied {} files to your assignment directory!".format(nfiles))
-    print("The files copied include: {}".format(files_to_move))
+def extra_file_names(config):
+    """List the names of the files in the extra_files directory of the
+    course, which are added to every template repo."""
+    course_dir = cf.get_config_option(config, "course_directory", True)
+    extra_path = Path(course_dir, "extra_files")
+    if not extra_path.is_dir():
+        return []
+    return sorted(os.listdir(extra_path))
 
 
 def create_extra_files(config, template_repo, assignment):
-    """Copy any extra files that exist the extra_files directory
+    """Copy any extra files (and directories) that exist the extra_files
+    directory. Files that are already up to date in the template repo are
+    not copied again.
 
     Parameters
     ----------
@@ -267,9 +419,20 @@ def create_extra_files(config, template_repo, assignment):
     extra_path = Path(course_dir, "extra_files")
     if extra_path.is_dir():
         print("Copying extra files: ")
-        for f in extra_path.iterdir():
-            print(" {}".format(f.relative_to(course_dir)))
-            shutil.copy(f, template_repo)
+        files_to_ignore = cf.get_config_option(
+            config, "files_to_ignore", False
+        )
+        changes = utils.sync_tree(
+            extra_path,
+            template_repo,
+            ignore=files_to_ignore or [],
+            sync_function=partial(
+                _sync_template_file,
+                assignment=assignment,
+                template_repo=template_repo,
+            ),
+        )
+        _print_changes(changes)
 
         # modify the readme with the assignment name
         readme_path = Path(template_repo, "README.md")
@@ -277,9 +440,45 @@ def create_extra_files(config, template_repo, assignment):
             add_assignment_to_readme(readme_path, assignment)
 
 
+def _print_changes(changes):
+    for change in ["added", "updated", "removed"]:
+        for path in changes[change]:
+            print(" {} {}".format(change, path))
+
+
+def _sync_template_file(src, target, assignment, template_repo):
+    """Sync one file into a template repo with ``utils.sync_file``. The
+    README.md at the top of the repo gets the assignment name as its title,
+    so it is compared with what it will look like instead."""
+    if Path(target) != Path(template_repo, "README.md"):
+        return utils.sync_file(src, target)
+    with open(src) as readme:
+        lines = readme.readlines()
+    return _write_if_changed(target, _readme_lines(lines, assignment))
+
+
+def _readme_lines(lines, assignment):
+    """The lines of the readme with the assignment name as its title."""
+    if len(lines) > 0:
+        lines = ["# Assignment {}\n".format(assignment)] + lines[1:]
+    return lines
+
+
+def _write_if_changed(path, lines):
+    """Write lines to path unless the file already has them. Returns
+    "added", "updated" or None, like ``utils.sync_file``."""
+    if not path.exists():
+        change = "added"
+    else:
+        with open(path) as f:
+            if f.readlines() == lines:
+                return None
+        change = "updated"
+    utils.write_file(path, lines)
+    return change
+
+
 def add_assignment_to_readme(path_to_readme, assignment):
     with open(path_to_readme) as readme:
         lines = readme.readlines()
-        if len(lines) > 0:
-            lines[0] = "# Assignment {}\n".format(assignment)
-            utils.write_file(path_to_readme, lines)
+    _write_if_changed(path_to_readme, _readme_lines(lines, assignment))
@@ -2,6 +2,8 @@
 
 import pytest
 import os
+import shutil
+from argparse import Namespace
 from pathlib import Path
 
 import abcclassroom.template as abctemplate
@@ -89,6 +91,104 @@ def test_move_git_dir(default_config, tmp_path):
     assert Path(template_path, ".git").exists()
 
 
+def test_new_update_template_several(default_config, tmp_path, monkeypatch):
+    """Test that several templates are built in one run, with one commit
+    message and one config write that lists all of them."""
+    default_config["course_directory"] = str(tmp_path)
+    cf.write_config(default_config, tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for assignment in ["hw2", "hw1"]:
+        release = Path(
+            tmp_path, default_config["course_materials"], "release", assignment
+        )
+        release.mkdir(parents=True)
+        release.joinpath("{}.ipynb".format(assignment)).touch()
+    commits = []
+    monkeypatch.setattr(
+        github,
+        "init_and_commit",
+        lambda directory, message: commits.append((directory.name, message())),
+    )
+
+    args = Namespace(
+        assignment=[],
+        all=True,
+        jobs=2,
+        mode="fail",
+        custom_message=False,
+        github=False,
+    )
+    abctemplate.new_update_template(args)
+    assert sorted(commits) == [
+        ("hw1-template", "Initial commit"),
+        ("hw2-template", "Initial commit"),
+    ]
+    templates = Path(tmp_path, default_config["template_dir"])
+    assert Path(templates, "hw1-template", "hw1.ipynb").exists()
+    assert Path(templates, "hw2-template", "hw2.ipynb").exists()
+    config = cf.get_config(tmp_path)
+    assert config["assignments"] == ["hw1", "hw2"]
+
+    # an assignment that is not in the release directory is reported, and
+    # the others are still built
+    args.all = False
+    args.assignment = ["hw1", "hw3"]
+    args.mode = "merge"
+    with pytest.raises(SystemExit):
+        abctemplate.new_update_template(args)
+    assert cf.get_config(tmp_path)["assignments"] == ["hw1", "hw2"]
+    assert not Path(templates, "hw3-template").exists()
+
+
+def test_new_update_template_asks_for_message_lazily(
+    default_config, tmp_path, monkeypatch
+):
+    """Test that a custom commit message is only asked for when a template
+    has something to commit, and only once for all of the templates."""
+    default_config["course_directory"] = str(tmp_path)
+    cf.write_config(default_config, tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for assignment in ["hw1", "hw2", "hw3"]:
+        release = Path(
+            tmp_path, default_config["course_materials"], "release", assignment
+        )
+        release.mkdir(parents=True)
+        release.joinpath("{}.ipynb".format(assignment)).touch()
+    prompts = []
+    monkeypatch.setattr(
+        github,
+        "get_commit_message",
+        lambda: prompts.append(1) or "Update assignments",
+    )
+    changed = set()
+    commits = []
+
+    def init_and_commit(directory, message):
+        # only the templates in `changed` have something to commit
+        if directory.name in changed:
+            commits.append((directory.name, message()))
+
+    monkeypatch.setattr(github, "init_and_commit", init_and_commit)
+    args = Namespace(
+        assignment=[],
+        all=True,
+        jobs=3,
+        mode="merge",
+        custom_message=True,
+        github=False,
+    )
+    abctemplate.new_update_template(args)
+    assert prompts == []
+
+    changed.update(["hw1-template", "hw3-template"])
+    abctemplate.new_update_template(args)
+    assert prompts == [1]
+    assert sorted(commits) == [
+        ("hw1-template", "Update assignments"),
+        ("hw3-template", "Update assignments"),
+    ]
+
+
 # Tests for copy_assignment_files
 def test_copy_assignment_files(default_config, tmp_path):
     """Test that files are moved to the template repo directory and that
@@ -121,31 +221,98 @@ def test_copy_assignment_files(default_config, tmp_path):
             assert afile not in os.listdir(template_repo)
 
 
-def test_copy_assignment_dirs(default_config, tmp_path, capfd):
-    """Test that when there is a directory in the extra_files dir, things
-    still copy as expected.
+def test_copy_assignment_files_sync(default_config, tmp_path):
+    """Test that only changed files are copied on later runs, and that files
+    deleted from the release directory are removed from the template, but
+    extra files and the .git directory are kept."""
+    default_config["course_directory"] = tmp_path
+    assignment = "assignment1"
+    cmpath = Path(
+        tmp_path, default_config["course_materials"], "release", assignment
+    )
+    cmpath.mkdir(parents=True)
+    cmpath.joinpath("file1.txt").write_text("one")
+    cmpath.joinpath("file2.txt").write_text("two")
+    Path(tmp_path, "extra_files").mkdir()
+    Path(tmp_path, "extra_files", ".gitignore").write_text("*.pyc")
+
+    template_repo = abctemplate.create_template_dir(default_config, assignment)
+    changes = abctemplate.copy_assignment_files(
+        default_config, template_repo, assignment
+    )
+    assert changes["added"] == ["file1.txt", "file2.txt"]
+    abctemplate.create_extra_files(default_config, template_repo, assignment)
+    Path(template_repo, ".git").mkdir()
+
+    cmpath.joinpath("file1.txt").write_text("one, changed")
+    cmpath.joinpath("file2.txt").unlink()
+    cmpath.joinpath("file3.txt").write_text("three")
+    changes = abctemplate.copy_assignment_files(
+        default_config, template_repo, assignment
+    )
+    assert changes == {
+        "added": ["file3.txt"],
+        "updated": ["file1.txt"],
+        "removed": ["file2.txt"],
+        "unchanged": [],
+    }
+    assert Path(template_repo, "file1.txt").read_text() == "one, changed"
+    assert sorted(os.listdir(template_repo)) == [
+        ".git",
+        ".gitignore",
+        "file1.txt",
+        "file3.txt",
+    ]
+
+    changes = abctemplate.copy_assignment_files(
+        default_config, template_repo, assignment
+    )
+    assert changes["unchanged"] == ["file1.txt", "file3.txt"]
+    assert changes["added"] == changes["updated"] == changes["removed"] == []
+
+
+def test_copy_assignment_dirs(default_config, tmp_path):
+    """Test that directories in the release directory are copied
+    recursively, and that ignored files are skipped at every level.
     """
     default_config["course_directory"] = tmp_path
+    default_config["files_to_ignore"].append("*.pyc")
     assignment = "assignment1"
     # first, set up the test course materials directory
     # and create some temporary files
     cmpath = Path(
         tmp_path, default_config["course_materials"], "release", assignment
     )
-    cmpath.mkdir(parents=True)
-    cmpath.joinpath("dummy-dir").mkdir()
+    cmpath.joinpath("data", "raw").mkdir(parents=True)
+    cmpath.joinpath("data", "raw", "values.csv").write_text("1,2,3")
+    cmpath.joinpath("data", "notes.txt").write_text("notes")
+    cmpath.joinpath("data", ".DS_Store").touch()
+    cmpath.joinpath("data", "raw", "module.pyc").touch()
+    cmpath.joinpath("data", ".ipynb_checkpoints").mkdir()
 
     # Manually create the dir to just test the copy function
     template_path = Path(
         tmp_path, default_config["template_dir"], assignment + "-template"
     )
     template_path.mkdir(parents=True)
-    abctemplate.copy_assignment_files(
+    changes = abctemplate.copy_assignment_files(
+        default_config, template_path, assignment
+    )
+    assert changes["added"] == ["data/notes.txt", "data/raw/values.csv"]
+    assert Path(template_path, "data", "raw", "values.csv").exists()
+    assert not Path(template_path, "data", ".DS_Store").exists()
+    assert not Path(template_path, "data", "raw", "module.pyc").exists()
+    assert not Path(template_path, "data", ".ipynb_checkpoints").exists()
+
+    # a directory removed from the release directory is removed from the
+    # template too
+    shutil.rmtree(cmpath.joinpath("data", "raw"))
+    changes = abctemplate.copy_assignment_files(
         default_config, template_path, assignment
     )
-    out, err = capfd.readouterr()
-    print(out)
-    assert "Oops - looks like" in out
+    assert changes["removed"] == ["data/raw"]
+    assert changes["unchanged"] == ["data/notes.txt"]
+    assert not Path(template_path, "data", "raw").exists()
 
 
 def test_copy_assignment_files_fails_nodir(default_config, tmp_path):
@@ -177,6 +344,28 @@ def test_create_extra_files(default_config, tmp_path):
     assert Path(template_repo, ".gitignore").exists()
 
 
+def test_create_extra_files_unchanged(default_config, tmp_path):
+    """Test that extra files (including the readme, which gets the
+    assignment name) are not written again when they haven't changed."""
+    default_config["course_directory"] = tmp_path
+    assignment = "assignment1"
+    Path(tmp_path, "extra_files").mkdir()
+    Path(tmp_path, "extra_files", ".gitignore").write_text("*.pyc")
+    with open(Path(tmp_path, "extra_files", "README.md"), "w") as f:
+        f.writelines(["# readme\n", "another line\n"])
+
+    template_repo = abctemplate.create_template_dir(default_config, assignment)
+    abctemplate.create_extra_files(default_config, template_repo, assignment)
+    readme = Path(template_repo, "README.md")
+    assert readme.read_text() == "# Assignment assignment1\nanother line\n"
+    # set the times back so that any rewrite would show up
+    for path in template_repo.iterdir():
+        os.utime(path, ns=(0, 0))
+    abctemplate.create_extra_files(default_config, template_repo, assignment)
+    assert readme.stat().st_mtime_ns == 0
+    assert Path(template_repo, ".gitignore").read_text() == "*.pyc"
+
+
 # Test for adding assignment name to readme contents
 
 
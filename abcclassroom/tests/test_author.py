@@ -0,0 +1,59 @@
+# Tests for author.py
+
+from pathlib import Path
+
+import nbformat
+from nbformat.v4 import new_code_cell, new_notebook
+
+import abcclassroom.author as abcauthor
+
+
+def write_master_notebook(path, answer):
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "### BEGIN SOLUTION\nx = {}\n### END SOLUTION".format(answer)
+            ),
+            new_code_cell(
+                "x\n{}".format(answer), metadata={"tags": ["public"]}
+            ),
+        ],
+        metadata={
+            "kernelspec": {
+                "name": "python3",
+                "display_name": "Python 3",
+                "language": "python",
+            }
+        },
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    nbformat.write(nb, str(path))
+
+
+def test_author_only_splits_changed_notebooks(sample_course_structure, capsys):
+    """Test that all master notebooks are split on the first run, and only
+    the changed ones after that."""
+    course_name, config = sample_course_structure
+    materials = Path(config["course_directory"], config["course_materials"])
+    hw1 = Path(materials, "master", "hw1", "hw1.ipynb")
+    hw2 = Path(materials, "master", "hw2", "hw2.ipynb")
+    write_master_notebook(hw1, 1)
+    write_master_notebook(hw2, 2)
+
+    abcauthor.author_assignments(jobs=2)
+    output = capsys.readouterr().out
+    assert "Split 2 of 2 notebooks (0 unchanged)." in output
+    assert Path(materials, "student", "hw1", "hw1.ipynb").exists()
+    assert Path(materials, "student", "hw2", "hw2.ipynb").exists()
+    assert len(list(Path(materials, "autograder", "hw2", "hw2").iterdir()))
+
+    write_master_notebook(hw2, 3)
+    abcauthor.author_assignments(jobs=2)
+    output = capsys.readouterr().out
+    assert "hw1/hw1.ipynb has not changed; skipping" in output
+    assert "Split hw2/hw2.ipynb in" in output
+    assert "Split 1 of 2 notebooks (1 unchanged)." in output
+
+    abcauthor.author_assignments(["hw1"], jobs=1, force=True)
+    output = capsys.readouterr().out
+    assert "Split 1 of 1 notebooks (0 unchanged)." in output
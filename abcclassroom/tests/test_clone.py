@@ -1,9 +1,11 @@
 # Tests for clone script
 
 import pytest
+import subprocess
 from pathlib import Path
 
 import abcclassroom.clone as abcclone
+import abcclassroom.config as cf
 
 # TODO - this should be a fixture
 test_data = {
@@ -94,6 +96,291 @@ def test_roster_wrong_format(sample_course_structure):
         abcclone.clone_repos(assignment_name, skip_existing=False)
 
 
+def test_clone_repos_parallel_summary(
+    sample_course_structure, monkeypatch, capsys
+):
+    """Test that cloning with several jobs reports failed repos in roster
+    order, regardless of the order in which the jobs finish."""
+
+    course_name, config = sample_course_structure
+    assignment_name = "test_assignment"
+    students = ["amy", "bob", "cat", "dan", "eve"]
+
+    roster_path = Path(config["course_directory"], "classroom_roster.csv")
+    roster_path.write_text(
+        '"identifier","github_username","github_id","name"\n'
+        + "".join('"{0}","{0}","",""\n'.format(s) for s in students)
+    )
+
+    def fake_clone(organization, repo, dest_dir, **clone_options):
+        if repo.endswith(("-bob", "-eve")):
+            raise RuntimeError("repository not found")
+        Path(config["course_directory"], dest_dir, repo).mkdir(parents=True)
+
+    monkeypatch.setattr(abcclone.gh, "clone_repo", fake_clone)
+    monkeypatch.setattr(abcclone.gh, "get_repo_index", lambda org: None)
+    monkeypatch.setattr(abcclone.gh, "get_fetched_head", lambda d: "abc123")
+    abcclone.clone_repos(assignment_name, skip_existing=False, jobs=4)
+
+    out = capsys.readouterr().out
+    assert "Cloned or updated 3 of 5 repos." in out
+    summary = out.split("Could not clone or update the following repos:")[1]
+    assert summary.split() == [
+        "test_assignment-bob",
+        "test_assignment-eve",
+    ]
+
+
+def test_clone_repos_skips_repos_not_in_index(
+    sample_course_structure, monkeypatch, capsys
+):
+    """Test that repos missing from the organization listing are reported
+    as missing without attempting a clone."""
+
+    course_name, config = sample_course_structure
+    assignment_name = "test_assignment"
+
+    roster_path = Path(config["course_directory"], "classroom_roster.csv")
+    roster_path.write_text(
+        '"identifier","github_username","github_id","name"\n'
+        '"amy","amy","",""\n'
+        '"bob","Bob","",""\n'
+        '"cat","cat","",""\n'
+    )
+    cloned = []
+
+    def fake_clone(organization, repo, dest_dir, **clone_options):
+        cloned.append(repo)
+        Path(config["course_directory"], dest_dir, repo).mkdir(parents=True)
+
+    monkeypatch.setattr(abcclone.gh, "clone_repo", fake_clone)
+    monkeypatch.setattr(
+        abcclone.gh,
+        "get_repo_index",
+        lambda org: {
+            "test_assignment-amy": None,
+            "test_assignment-bob": None,
+        },
+    )
+    monkeypatch.setattr(abcclone.gh, "get_fetched_head", lambda d: "abc123")
+    abcclone.clone_repos(assignment_name, skip_existing=False)
+
+    assert sorted(cloned) == ["test_assignment-Bob", "test_assignment-amy"]
+    out = capsys.readouterr().out
+    assert "Could not clone or update the following repos" in out
+    assert "test_assignment-cat" in out
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git"] + list(args), cwd=cwd, check=True)
+
+
+@pytest.fixture
+def local_remotes(sample_course_structure, tmp_path, monkeypatch):
+    """Creates bare repositories in tmp_path that stand in for the student
+    repos on GitHub, and a roster listing those students."""
+    course_name, config = sample_course_structure
+    assignment_name = "test_assignment"
+    students = ["amy", "bob"]
+    remotes = Path(tmp_path, "remotes")
+
+    for var in ["GIT_AUTHOR", "GIT_COMMITTER"]:
+        monkeypatch.setenv(var + "_NAME", "abc")
+        monkeypatch.setenv(var + "_EMAIL", "abc@example.com")
+
+    for s in students:
+        repo = "{}-{}".format(assignment_name, s)
+        work = Path(remotes, repo)
+        work.mkdir(parents=True)
+        git("init", "-q", cwd=work)
+        git("checkout", "-q", "-b", "master", cwd=work)
+        Path(work, "nb1.ipynb").write_text("first")
+        git("add", "nb1.ipynb", cwd=work)
+        git("commit", "-q", "-m", "first", cwd=work)
+        git("clone", "-q", "--bare", str(work), repo + ".git", cwd=remotes)
+
+    Path(config["course_directory"], "classroom_roster.csv").write_text(
+        '"identifier","github_username","github_id","name"\n'
+        + "".join('"{0}","{0}","",""\n'.format(s) for s in students)
+    )
+    monkeypatch.setattr(
+        abcclone.gh,
+        "get_repo_url",
+        lambda org, repo: str(Path(remotes, repo + ".git")),
+    )
+    monkeypatch.setattr(abcclone.gh, "get_repo_index", lambda org: None)
+    return config, assignment_name, remotes
+
+
+def test_clone_repos_skips_unchanged_repos(local_remotes, monkeypatch):
+    """Test that a second run only pulls and copies files for the repos
+    that have new commits on the remote."""
+    config, assignment_name, remotes = local_remotes
+    assignment_dir = Path(
+        config["course_directory"], config["clone_dir"], assignment_name
+    )
+    abcclone.clone_repos(assignment_name, skip_existing=False)
+
+    manifest = abcclone.load_clone_manifest(assignment_dir)
+    assert sorted(manifest) == ["test_assignment-amy", "test_assignment-bob"]
+    first_sha = manifest["test_assignment-bob"]["sha"]
+
+    # bob pushes a new commit
+    work = Path(remotes, "test_assignment-bob")
+    Path(work, "nb1.ipynb").write_text("second")
+    git("commit", "-q", "-a", "-m", "second", cwd=work)
+    git(
+        "push",
+        "-q",
+        str(Path(remotes, "test_assignment-bob.git")),
+        "master",
+        cwd=work,
+    )
+
+    pulled = []
+    copied = []
+    real_pull = abcclone.gh.pull_from_github
+    real_copy = abcclone.copy_assignment_files
+
+    def pull(directory, *args, **kwargs):
+        pulled.append(Path(directory).name)
+        real_pull(directory, *args, **kwargs)
+
+    def copy(config, student, assignment_name, mode="copy"):
+        copied.append(student)
+        real_copy(config, student, assignment_name, mode)
+
+    monkeypatch.setattr(abcclone.gh, "pull_from_github", pull)
+    monkeypatch.setattr(abcclone, "copy_assignment_files", copy)
+    abcclone.clone_repos(assignment_name, skip_existing=False)
+
+    assert pulled == ["test_assignment-bob"]
+    assert copied == ["bob"]
+    manifest = abcclone.load_clone_manifest(assignment_dir)
+    assert manifest["test_assignment-bob"]["sha"] != first_sha
+    submitted = Path(
+        config["course_directory"],
+        config["course_materials"],
+        "submitted",
+        "bob",
+        assignment_name,
+        "nb1.ipynb",
+    )
+    assert submitted.read_text() == "second"
+
+    # an unpushed local commit (e.g. feedback) doesn't make the repo look
+    # changed, even after the next pull merges it with new remote commits
+    amy_repo = Path(assignment_dir, "test_assignment-amy")
+    # newer versions of git refuse to pull into a branch with local commits
+    # unless told how
+    git("config", "pull.rebase", "false", cwd=amy_repo)
+    Path(amy_repo, "feedback.html").write_text("feedback")
+    git("add", "feedback.html", cwd=amy_repo)
+    git("commit", "-q", "-m", "feedback", cwd=amy_repo)
+    work = Path(remotes, "test_assignment-amy")
+    Path(work, "nb1.ipynb").write_text("second")
+    git("commit", "-q", "-a", "-m", "second", cwd=work)
+    git(
+        "push",
+        "-q",
+        str(Path(remotes, "test_assignment-amy.git")),
+        "master",
+        cwd=work,
+    )
+    pulled.clear()
+    abcclone.clone_repos(assignment_name, skip_existing=False)
+    assert pulled == ["test_assignment-amy"]
+    pulled.clear()
+    abcclone.clone_repos(assignment_name, skip_existing=False)
+    assert pulled == []
+
+    # force updates everything
+    pulled.clear()
+    abcclone.clone_repos(assignment_name, skip_existing=False, force=True)
+    assert sorted(pulled) == ["test_assignment-amy", "test_assignment-bob"]
+
+
+def test_shallow_sparse_clone_and_pull(local_remotes, monkeypatch):
+    """Test that shallow, blobless, sparse clones only check out notebooks
+    and can still be updated with a pull."""
+    config, assignment_name, remotes = local_remotes
+    # git ignores --depth for plain local paths, so use file:// urls
+    monkeypatch.setattr(
+        abcclone.gh,
+        "get_repo_url",
+        lambda org, repo: Path(remotes, repo + ".git").as_uri(),
+    )
+    work = Path(remotes, "test_assignment-amy")
+    Path(work, "data.csv").write_text("lots of data")
+    Path(work, "nb1.ipynb").write_text("second")
+    git("add", "data.csv", "nb1.ipynb", cwd=work)
+    git("commit", "-q", "-m", "second", cwd=work)
+    git("push", "-q", str(work) + ".git", "master", cwd=work)
+
+    abcclone.clone_repos(
+        assignment_name, False, depth=1, blobless=True, sparse=True
+    )
+    repo = Path(
+        config["course_directory"],
+        config["clone_dir"],
+        assignment_name,
+        "test_assignment-amy",
+    )
+    assert Path(repo, "nb1.ipynb").read_text() == "second"
+    assert not Path(repo, "data.csv").exists()
+    log = subprocess.run(
+        ["git", "log", "--oneline"], cwd=repo, stdout=subprocess.PIPE
+    )
+    assert len(log.stdout.splitlines()) == 1
+
+    Path(work, "nb1.ipynb").write_text("third")
+    git("commit", "-q", "-a", "-m", "third", cwd=work)
+    git("push", "-q", str(work) + ".git", "master", cwd=work)
+    abcclone.clone_repos(assignment_name, False)
+    assert Path(repo, "nb1.ipynb").read_text() == "third"
+
+
+def test_clone_from_mirror(local_remotes, tmp_path):
+    """Test that clones borrow objects from a local bare mirror, and that
+    the mirror is updated before the student repo is pulled."""
+    config, assignment_name, remotes = local_remotes
+    mirror_dir = Path(tmp_path, "mirrors")
+    abcclone.clone_repos(assignment_name, False, mirror_dir=str(mirror_dir))
+
+    mirror = Path(
+        mirror_dir, "your-organization-name", "test_assignment-amy.git"
+    )
+    assert Path(mirror, "HEAD").exists()
+    repo = Path(
+        config["course_directory"],
+        config["clone_dir"],
+        assignment_name,
+        "test_assignment-amy",
+    )
+    alternates = Path(repo, ".git", "objects", "info", "alternates")
+    assert Path(alternates.read_text().strip()) == Path(mirror, "objects")
+    # the mirror must never prune objects the clone borrows
+    gc_auto = subprocess.run(
+        ["git", "config", "gc.auto"], cwd=mirror, stdout=subprocess.PIPE
+    )
+    assert gc_auto.stdout.strip() == b"0"
+
+    work = Path(remotes, "test_assignment-amy")
+    Path(work, "nb1.ipynb").write_text("second")
+    git("commit", "-q", "-a", "-m", "second", cwd=work)
+    git("push", "-q", str(work) + ".git", "master", cwd=work)
+    abcclone.clone_repos(assignment_name, False, mirror_dir=str(mirror_dir))
+
+    assert Path(repo, "nb1.ipynb").read_text() == "second"
+    mirror_head = subprocess.run(
+        ["git", "rev-parse", "master"], cwd=mirror, stdout=subprocess.PIPE
+    )
+    repo_head = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=repo, stdout=subprocess.PIPE
+    )
+    assert mirror_head.stdout == repo_head.stdout
+
+
 # TODO: Test that when the roster is empty it fails gracefully
 
 # test_clone_no_local_repo(default_config, tmp_path, monkeypatch):
@@ -123,3 +410,51 @@ def test_copy_assignment_files(default_config, test_files):
             ).exists()
             is False
         )
+
+
+def test_copy_assignment_files_hardlink(default_config, test_files):
+    """Test that the submitted notebooks can be hardlinked to the cloned
+    ones instead of copied."""
+    clone_dir = Path(
+        default_config["course_directory"], default_config["clone_dir"]
+    )
+    materials_dir = Path(
+        default_config["course_directory"], default_config["course_materials"]
+    )
+    assignment = test_data["assignment"]
+    student = test_data["students"][0]
+    abcclone.copy_assignment_files(
+        default_config, student, assignment, "hardlink"
+    )
+    cloned = Path(
+        clone_dir, assignment, "{}-{}".format(assignment, student), "nb1.ipynb"
+    )
+    submitted = Path(materials_dir, "submitted", student, assignment)
+    assert Path(submitted, "nb1.ipynb").samefile(cloned)
+
+    # going back to copies breaks the links
+    abcclone.copy_assignment_files(default_config, student, assignment)
+    assert not Path(submitted, "nb1.ipynb").samefile(cloned)
+    assert Path(submitted, "nb1.ipynb").read_text() == cloned.read_text()
+
+
+def test_clone_options_override_config(local_remotes, monkeypatch):
+    """Test that blobless and sparse clones set in config.yml can be turned
+    off for one run."""
+    config, assignment_name, remotes = local_remotes
+    with cf.edit_config() as current_config:
+        current_config["clone_blobless"] = True
+        current_config["clone_sparse"] = True
+    options = []
+
+    def clone_and_copy(*args):
+        options.append(args[7])
+        return {"sha": "", "fetched": ""}
+
+    monkeypatch.setattr(abcclone, "clone_and_copy_repo", clone_and_copy)
+    abcclone.clone_repos(assignment_name, False, force=True)
+    assert options[-1]["blobless"] and options[-1]["sparse"]
+    abcclone.clone_repos(
+        assignment_name, False, force=True, blobless=False, sparse=False
+    )
+    assert not options[-1]["blobless"] and not options[-1]["sparse"]
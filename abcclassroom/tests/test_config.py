@@ -2,6 +2,7 @@
 
 import pytest
 import os
+from concurrent.futures import ThreadPoolExecutor
 from ruamel.yaml import YAML
 from pathlib import Path
 
@@ -100,3 +101,86 @@ def test_set_config_option(default_config, tmp_path):
     )
     assert len(abcconfig.get_config_option(config, "pie")) == 2
     assert "sugar" in abcconfig.get_config_option(config, "pie")
+
+
+def test_get_config_cached(default_config, tmp_path, monkeypatch):
+    """Test that config.yml is only parsed again after it changes, and that
+    changing the returned config doesn't change the cached copy."""
+    abcconfig.write_config(default_config, configpath=tmp_path)
+    loads = []
+    real_load = abcconfig._yaml.load
+
+    def counting_load(stream):
+        loads.append(stream)
+        return real_load(stream)
+
+    monkeypatch.setattr(abcconfig._yaml, "load", counting_load)
+    config = abcconfig.get_config(configpath=tmp_path)
+    config["clone_dir"] = "changed"
+    assert abcconfig.get_config(configpath=tmp_path) == default_config
+    assert len(loads) == 1
+
+    default_config["clone_dir"] = "elsewhere"
+    abcconfig.write_config(default_config, configpath=tmp_path)
+    config = abcconfig.get_config(configpath=tmp_path)
+    assert config["clone_dir"] == "elsewhere"
+    assert len(loads) == 2
+
+
+def test_get_course_paths(default_config, tmp_path):
+    default_config["course_directory"] = str(tmp_path)
+    roster = Path(tmp_path.parent, "roster.csv")
+    default_config["roster"] = str(roster)
+    paths = abcconfig.get_course_paths(default_config)
+    assert paths.course_dir == tmp_path
+    assert paths.clone_dir == Path(tmp_path, "cloned-repos")
+    assert paths.materials_dir == Path(tmp_path, "nbgrader")
+    assert paths.roster == roster
+
+    del default_config["template_dir"]
+    assert abcconfig.get_course_paths(default_config).template_dir is None
+    with pytest.raises(SystemExit):
+        abcconfig.get_course_paths(default_config, required=["template_dir"])
+
+
+def test_update_config_option_keeps_order(default_config):
+    default_config["pie"] = ["pecan", "apple"]
+    abcconfig.update_config_option(default_config, "pie", "sugar", True)
+    abcconfig.update_config_option(default_config, "pie", "pecan", True)
+    assert default_config["pie"] == ["pecan", "apple", "sugar"]
+
+
+def test_edit_config(default_config, tmp_path):
+    abcconfig.write_config(default_config, configpath=tmp_path)
+    with abcconfig.edit_config(tmp_path) as config:
+        assert Path(tmp_path, "config.yml.lock").exists()
+        abcconfig.update_config_option(config, "assignments", "hw1", True)
+        abcconfig.update_config_option(config, "assignments", "hw2", True)
+    assert not Path(tmp_path, "config.yml.lock").exists()
+    config = abcconfig.get_config(configpath=tmp_path)
+    assert config["assignments"] == ["hw1", "hw2"]
+    assert list(tmp_path.iterdir()) == [Path(tmp_path, "config.yml")]
+
+    # nothing is written if the changes fail part way through
+    with pytest.raises(ValueError):
+        with abcconfig.edit_config(tmp_path) as config:
+            abcconfig.update_config_option(config, "pie", "apple")
+            raise ValueError
+    assert "pie" not in abcconfig.get_config(configpath=tmp_path)
+    assert not Path(tmp_path, "config.yml.lock").exists()
+
+
+def test_edit_config_concurrent(default_config, tmp_path):
+    """Test that changes made at the same time from several threads are
+    all kept."""
+    abcconfig.write_config(default_config, configpath=tmp_path)
+    names = ["hw{}".format(i) for i in range(8)]
+
+    def add_assignment(name):
+        with abcconfig.edit_config(tmp_path) as config:
+            abcconfig.update_config_option(config, "assignments", name, True)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(add_assignment, names))
+    config = abcconfig.get_config(configpath=tmp_path)
+    assert sorted(config["assignments"]) == names
@@ -1,3 +1,11 @@
+# Tests for feedback script
+
+import pytest
+from pathlib import Path
+
+import abcclassroom.feedback as abcfeedback
+import abcclassroom.github as github
+
 # from pathlib import Path
 #
 # import abcclassroom.feedback as abcfeedback
@@ -32,3 +40,131 @@
 #     # Add html file to one student's directory
 #
 #     # Run abc-feedback
+
+
+@pytest.fixture
+def feedback_repos(sample_course_structure, monkeypatch):
+    """Creates local student repos and a feedback report for each student,
+    plus a roster that also lists a student without a local repo."""
+    course_name, config = sample_course_structure
+    course_dir = Path(config["course_directory"])
+    assignment = "assignment1"
+    students = ["alana", "bert", "cat"]
+
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "abc")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "abc@example.com")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "abc")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "abc@example.com")
+
+    Path(course_dir, "classroom_roster.csv").write_text(
+        '"identifier","github_username","github_id","name"\n'
+        + "".join('"{0}","{0}","",""\n'.format(s) for s in students)
+        + '"dan","dan","",""\n'
+    )
+    for s in students:
+        repo = Path(
+            course_dir,
+            config["clone_dir"],
+            assignment,
+            "{}-{}".format(assignment, s),
+        )
+        repo.mkdir(parents=True)
+        repo.joinpath("{}.ipynb".format(assignment)).touch()
+        github.init_and_commit(repo)
+        feedback = Path(
+            course_dir, config["course_materials"], "feedback", s, assignment
+        )
+        feedback.mkdir(parents=True)
+        feedback.joinpath("{}.html".format(assignment)).write_text(s)
+    return config, assignment, students
+
+
+def test_feedback_pipeline_reports_failures(
+    feedback_repos, monkeypatch, capsys
+):
+    """Test that feedback is copied and committed for every student with a
+    local repo, and that a failed push is reported at the end without
+    stopping the other students."""
+    config, assignment, students = feedback_repos
+    pushed = []
+
+    def fake_push(directory, branch="master"):
+        if directory.name.endswith("bert"):
+            raise RuntimeError("rejected")
+        pushed.append(directory.name)
+
+    monkeypatch.setattr(github, "get_repo_index", lambda org: None)
+    monkeypatch.setattr(github, "push_to_github", fake_push)
+    abcfeedback.copy_feedback_files(
+        assignment, push_to_github=True, jobs=2, push_jobs=2
+    )
+
+    for s in students:
+        repo = Path(
+            config["clone_dir"], assignment, "{}-{}".format(assignment, s)
+        )
+        assert Path(repo, "{}.html".format(assignment)).read_text() == s
+        assert not github.repo_changed(repo)
+
+    assert sorted(pushed) == ["assignment1-alana", "assignment1-cat"]
+    out = capsys.readouterr().out
+    assert "does not exist; skipping" in out
+    summary = out.split("Could not deliver feedback")[1]
+    assert "bert (push failed): rejected" in summary
+    assert "alana" not in summary
+
+
+def test_scrub_feedback_files_skips_scrubbed(feedback_repos, capsys):
+    """Test that reports are scrubbed once, and skipped the next time
+    unless they change."""
+    config, assignment, students = feedback_repos
+    feedback_dir = Path(
+        config["course_directory"], config["course_materials"], "feedback"
+    )
+    hidden = (
+        '<span class="c1">### BEGIN HIDDEN TESTS</span>\n'
+        "assert x == 1\n"
+        '<span class="c1">### END HIDDEN TESTS</span>\n'
+    )
+    for s in students:
+        Path(feedback_dir, s, assignment, "assignment1.html").write_text(
+            s + hidden
+        )
+
+    assert abcfeedback.scrub_feedback_files(feedback_dir, assignment) == 3
+    for s in students:
+        report = Path(feedback_dir, s, assignment, "assignment1.html")
+        assert report.read_text() == s + "\n"
+
+    # a new report for one student; the others are already clean
+    Path(feedback_dir, "bert", assignment, "assignment1.html").write_text(
+        "bert" + hidden
+    )
+    capsys.readouterr()
+    assert abcfeedback.scrub_feedback_files(feedback_dir, assignment) == 1
+    out = capsys.readouterr().out
+    assert (
+        out == "Removed hidden tests from bert/assignment1/assignment1.html\n"
+    )
+
+
+def test_feedback_selected_students(feedback_repos):
+    """Test that only the selected students get feedback."""
+    config, assignment, students = feedback_repos
+    abcfeedback.copy_feedback_files(assignment, selected_students=["cat"])
+    for s in students:
+        report = Path(
+            config["clone_dir"],
+            assignment,
+            "{}-{}".format(assignment, s),
+            "{}.html".format(assignment),
+        )
+        assert report.exists() == (s == "cat")
+
+
+def test_scrub_feedback_files_no_feedback_dir(tmp_path):
+    """Test that there is nothing to do (and nothing is written) when there
+    is no feedback directory yet."""
+    feedback_dir = Path(tmp_path, "feedback")
+    assert abcfeedback.scrub_feedback_files(feedback_dir, "assignment1") == 0
+    assert not feedback_dir.exists()
@@ -0,0 +1,94 @@
+# Tests for github methods
+
+import pytest
+
+import abcclassroom.github as abcgithub
+
+
+@pytest.fixture(autouse=True)
+def no_cached_sessions(monkeypatch):
+    """Start each test without any logged-in GitHub sessions."""
+    monkeypatch.setattr(abcgithub, "_sessions", {})
+
+
+class FakeRepository:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeOrganization:
+    """Stands in for a github3 Organization. Hands out repositories one
+    page at a time, the way the github3 iterator walks the API pages."""
+
+    def __init__(self, names, per_page=2):
+        self.names = names
+        self.per_page = per_page
+        self.pages_requested = 0
+
+    def repositories(self):
+        for start in range(0, len(self.names), self.per_page):
+            self.pages_requested += 1
+            for name in self.names[start : start + self.per_page]:
+                yield FakeRepository(name)
+
+
+class FakeGitHub:
+    def __init__(self, organization):
+        self.org = organization
+        self.org_requests = []
+
+    def organization(self, org):
+        self.org_requests.append(org)
+        return self.org
+
+    def repository(self, org, repository):
+        return FakeRepository(repository)
+
+
+def test_get_repo_index(monkeypatch):
+    """Test that all pages of repos end up in the index, keyed by lower case
+    name, from a single organization lookup."""
+    names = ["hw1-Alana", "hw1-bert", "hw1-template", "hw2-bert", "hw2-cat"]
+    fake_org = FakeOrganization(names)
+    fake_gh = FakeGitHub(fake_org)
+    monkeypatch.setattr(abcgithub.gh3, "login", lambda token: fake_gh)
+
+    index = abcgithub.get_repo_index("test-org", token="abc123")
+
+    assert fake_gh.org_requests == ["test-org"]
+    assert fake_org.pages_requested == 3
+    assert sorted(index) == sorted(n.lower() for n in names)
+    assert index["hw1-alana"].name == "hw1-Alana"
+    assert "hw1-dan" not in index
+
+
+def test_get_repo_index_no_token(monkeypatch):
+    """Test that we return None (so callers fall back to trying each repo)
+    when the organization can't be listed."""
+    # gh3.login returns None when not given any credentials
+    monkeypatch.setattr(abcgithub.gh3, "login", lambda token: None)
+    assert abcgithub.get_repo_index("test-org") is None
+
+
+def test_github_session_is_shared(monkeypatch):
+    """Test that we only log in once per token, and that the token from the
+    auth file is used when none is given."""
+    logins = []
+
+    def fake_login(token):
+        logins.append(token)
+        return FakeGitHub(FakeOrganization([]))
+
+    monkeypatch.setattr(abcgithub.gh3, "login", fake_login)
+    monkeypatch.setattr(
+        abcgithub.cf, "get_github_auth", lambda: {"token": "abc123"}
+    )
+
+    session = abcgithub.get_github_session()
+    assert abcgithub.get_github_session("abc123") is session
+    assert abcgithub.remote_repo_exists("test-org", "hw1-bert")
+    abcgithub.get_repo_index("test-org")
+    assert logins == ["abc123"]
+
+    assert abcgithub.get_github_session("def456") is not session
+    assert logins == ["abc123", "def456"]
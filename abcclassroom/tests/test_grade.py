@@ -0,0 +1,77 @@
+# Tests for the parallel grading runner
+
+import csv
+import pytest
+from pathlib import Path
+
+import nbformat
+from nbformat.v4 import new_code_cell, new_notebook
+
+import abcclassroom.grade as abcgrade
+
+
+def write_notebook(path, *sources):
+    nb = new_notebook(cells=[new_code_cell(s) for s in sources])
+    nb.metadata.kernelspec = {
+        "name": "python3",
+        "display_name": "Python 3",
+        "language": "python",
+    }
+    nbformat.write(nb, str(path))
+    return str(path)
+
+
+def test_grade_notebooks_check_redefined(tmp_path):
+    """Test that notebooks that define their own check function are
+    reported in the table without being run."""
+    paths = [
+        write_notebook(Path(tmp_path, "nb1.ipynb"), "def check(x):\n    pass"),
+        write_notebook(Path(tmp_path, "nb2.ipynb"), "check = print"),
+    ]
+    results = abcgrade.grade_notebooks(paths, jobs=2)
+
+    assert [r.notebook for r in results] == paths
+    assert [r.status for r in results] == ["check-redefined"] * 2
+    assert not Path(tmp_path, "nb1-graded.ipynb").exists()
+
+
+def test_grade_notebooks_isolated_with_timeout(tmp_path):
+    """Test that notebooks run in a copy of their directory, that the
+    graded notebook is copied back and that a slow notebook times out."""
+    pytest.importorskip("ipykernel")
+    Path(tmp_path, "data.txt").write_text("42")
+    paths = [
+        write_notebook(
+            Path(tmp_path, "nb1.ipynb"),
+            "x = open('data.txt').read()",
+            "open('output.txt', 'w').write(x)",
+            "import os\nassert not os.path.exists('nb2.ipynb')",
+        ),
+        write_notebook(
+            Path(tmp_path, "nb2.ipynb"), "import time\ntime.sleep(30)"
+        ),
+    ]
+    results = abcgrade.grade_notebooks(paths, jobs=2, timeout=2)
+
+    assert [r.status for r in results] == ["graded", "timeout"]
+    assert Path(tmp_path, "nb1-graded.ipynb").exists()
+    # the notebook ran in a temporary copy of the directory
+    assert not Path(tmp_path, "output.txt").exists()
+
+    table = Path(tmp_path, "grades.csv")
+    abcgrade.write_grade_table(results, table)
+    with open(table, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(abcgrade.GradeResult._fields)
+    assert [row[1] for row in rows[1:]] == ["graded", "timeout"]
+
+
+def test_grade_notebooks_timeout_is_per_notebook(tmp_path):
+    """Test that the timeout limits the whole notebook, not each cell."""
+    pytest.importorskip("ipykernel")
+    path = write_notebook(
+        Path(tmp_path, "nb.ipynb"), *["import time\ntime.sleep(1)"] * 6
+    )
+    results = abcgrade.grade_notebooks([path], jobs=1, timeout=3)
+    assert results[0].status == "timeout"
+    assert results[0].seconds < 10
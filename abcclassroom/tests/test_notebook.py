@@ -0,0 +1,122 @@
+# Tests for notebook.py
+
+import os
+
+import nbformat
+import pytest
+from nbformat.v4 import new_code_cell, new_notebook
+
+import abcclassroom.notebook as abcnb
+
+
+def test_split_notebook(tmp_path):
+    """Test that split_notebook writes the student notebook, public tests
+    for the student and all tests for the autograder."""
+    master = new_notebook(
+        cells=[
+            new_code_cell(
+                "### BEGIN SOLUTION\nx = 1\n### END SOLUTION",
+            ),
+            new_code_cell("x\n1", metadata={"tags": ["public"]}),
+            new_code_cell("x + 1\n2", metadata={"tags": ["private"]}),
+        ],
+        metadata={
+            "kernelspec": {
+                "name": "conda-env-py",
+                "display_name": "Python [conda env:earth-analytics]",
+                "language": "python",
+            },
+            "language_info": {"name": "python", "version": "3.8.5"},
+        },
+    )
+    master_path = os.path.join(tmp_path, "hw1.ipynb")
+    nbformat.write(master, master_path)
+    student_path = os.path.join(tmp_path, "student")
+    autograder_path = os.path.join(tmp_path, "autograder")
+
+    abcnb.split_notebook(master_path, student_path, autograder_path)
+
+    student_nb = nbformat.read(
+        os.path.join(student_path, "hw1.ipynb"), as_version=4
+    )
+    assert student_nb.metadata.kernelspec.name == "python3"
+    assert student_nb.metadata.kernelspec.display_name == "Python 3"
+    assert "x = 1" not in student_nb.cells[0].source
+    assert student_nb.cells[1].source.startswith('check("hw1/q-')
+    assert student_nb.cells[2].source.startswith('check("hw1/q-')
+
+    public_test = student_nb.cells[1].source.split('"')[1]
+    private_test = student_nb.cells[2].source.split('"')[1]
+    assert os.listdir(os.path.join(student_path, "hw1")) == [
+        os.path.basename(public_test)
+    ]
+    assert sorted(os.listdir(os.path.join(autograder_path, "hw1"))) == sorted(
+        [os.path.basename(public_test), os.path.basename(private_test)]
+    )
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        'check("hw1/q-abc.py")',
+        "check('hw1/q-abc.py')",
+        'check(\n    "hw1/q-abc.py"\n)',
+        'check("hw1/q-abc.py", points=2)',
+    ],
+)
+def test_check_paths(source):
+    """Test that the test file is found however nbclean quotes it."""
+    assert abcnb._check_paths(source) == ["hw1/q-abc.py"]
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "def check(path):\n    return True",
+        "check = print",
+        "x, (y, check) = 1, (2, 3)",
+        "import mymodule as check",
+        "import check",
+        "from mymodule import other as check",
+        "for check in range(3):\n    pass",
+        "with open('f') as check:\n    pass",
+        "class check:\n    pass",
+    ],
+)
+def test_notebook_redefines_check(source):
+    nb = new_notebook(
+        cells=[
+            new_code_cell("%matplotlib inline\nx = 1"),
+            new_code_cell("this is not python"),
+            new_code_cell(source),
+        ]
+    )
+    assert abcnb.notebook_redefines_check(nb)
+
+
+def test_notebook_does_not_redefine_check():
+    nb = new_notebook(
+        cells=[
+            new_code_cell("%matplotlib inline\nimport os"),
+            new_code_cell("check('tests/q1.py')"),
+            new_code_cell("checker = 1\nx.check = 2\nd['check'] = 3"),
+            new_code_cell("from mymodule import check"),
+        ]
+    )
+    assert not abcnb.notebook_redefines_check(nb)
+
+
+def test_split_notebook_does_not_redefine_check(tmp_path):
+    """The student notebook made from the sample master notebook imports
+    `check` from the grading module, which must not count as redefining
+    it."""
+    master_path = os.path.join(
+        os.path.dirname(__file__), "..", "..", "master", "01-lecture.ipynb"
+    )
+    student_path = os.path.join(tmp_path, "student")
+    autograder_path = os.path.join(tmp_path, "autograder")
+    abcnb.split_notebook(master_path, student_path, autograder_path)
+
+    for path in (master_path, os.path.join(student_path, "01-lecture.ipynb")):
+        nb = nbformat.read(path, as_version=4)
+        assert not abcnb.notebook_redefines_check(nb)
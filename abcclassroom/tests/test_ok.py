@@ -0,0 +1,154 @@
+# Tests for the OK test runner and notebook grading
+
+import os
+import pytest
+from pathlib import Path
+
+from nbformat.v4 import new_code_cell, new_notebook, new_output
+
+import abcclassroom.ok as abcok
+
+ok_test = """
+test = {
+    "name": "q1",
+    "points": 1,
+    "suites": [
+        {
+            "cases": [
+                {"code": ">>> x\\n1", "hidden": False, "points": 1},
+                {"code": ">>> x + 1\\n3", "hidden": False, "points": 2},
+            ],
+            "scored": True,
+            "setup": "",
+            "teardown": "",
+            "type": "doctest",
+        }
+    ],
+}
+"""
+
+
+@pytest.fixture
+def ok_test_file(tmp_path):
+    """Writes an OK test file with two cases, one that passes and one that
+    fails when x = 1."""
+    path = Path(tmp_path, "q1.py")
+    path.write_text(ok_test)
+    return str(path)
+
+
+def test_check_structured_result(ok_test_file):
+    result = abcok.check(ok_test_file, {"x": 1})
+    assert result.to_dict() == {
+        "points": 1,
+        "max_points": 3,
+        "passed": 1,
+        "failed": 1,
+    }
+    bundle = result._repr_mimebundle_()
+    assert bundle == {abcok.RESULT_MIME_TYPE: result.to_dict()}
+
+
+def test_grade_notebook_reads_structured_results(monkeypatch):
+    """Test that grade_notebook uses the structured results when they are
+    there, and still reads the html of notebooks that don't have them."""
+    structured = new_output(
+        "display_data",
+        data={
+            "text/html": "<p>this html is not parsed</p>",
+            abcok.RESULT_MIME_TYPE: {
+                "points": 1,
+                "max_points": 3,
+                "passed": 1,
+                "failed": 1,
+            },
+        },
+    )
+    html_only = new_output(
+        "display_data",
+        data={"text/html": "<p>All 2 tests passed! Points: 2.</p>"},
+    )
+    executed_nb = new_notebook(
+        cells=[
+            new_code_cell("x = 1"),
+            new_code_cell("check('tests/q1.py')", outputs=[structured]),
+            new_code_cell("check('tests/q2.py')", outputs=[html_only]),
+        ]
+    )
+    monkeypatch.setattr(
+        abcok, "execute_notebook", lambda path, timeout=None: executed_nb
+    )
+    assert abcok.grade_notebook("nb.ipynb") == [(1, 3), (2, 2)]
+
+
+def test_from_file_cache(ok_test_file):
+    """Test that test files are only parsed again when they change."""
+    first = abcok.OKTest.from_file(ok_test_file)
+    stat = os.stat(ok_test_file)
+
+    # same size and modification time: the cached parse is used
+    Path(ok_test_file).write_text(ok_test.replace("x + 1", "x + 2"))
+    os.utime(ok_test_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    second = abcok.OKTest.from_file(ok_test_file)
+    assert second.tests == first.tests
+    assert second.examples is first.examples
+
+    # modification time changed: the file is parsed again
+    os.utime(ok_test_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    third = abcok.OKTest.from_file(ok_test_file)
+    assert third.tests[1][1] == ">>> x + 2\n3"
+    assert abcok.check(ok_test_file, {"x": 1}).grade == (3, 3)
+
+
+def test_html_rendered_on_display(ok_test_file, monkeypatch):
+    """Test that running a check doesn't highlight the failed test code
+    until the result is displayed."""
+    calls = []
+
+    def fake_highlight(code, lexer, formatter):
+        calls.append(code)
+        return code
+
+    monkeypatch.setattr(abcok, "highlight", fake_highlight)
+    result = abcok.check(ok_test_file, {"x": 1})
+    assert calls == []
+    assert [t.passed for t in result.failed_tests] == [False]
+
+    html = result._repr_html_()
+    assert calls == [">>> x + 1\n3"]
+    assert "test #1</strong> passed!" in html
+    assert "color: red;'>" in html
+
+
+def test_run_doctests_output_per_case():
+    """Test that a batch of doctests keeps the output of each case apart,
+    including what the tests write to stderr."""
+    cases = [
+        ("first", ">>> import sys; print('one', file=sys.stderr)\n", None),
+        ("second", ">>> x\n2\n", None),
+        ("third", ">>> import sys; print('three', file=sys.stderr)\n", None),
+        ("fourth", ">>> x + 1\n3\n", None),
+    ]
+    results = abcok.run_doctests(cases, {"x": 1})
+    assert [passed for passed, _ in results] == [True, False, True, False]
+    assert results[0][1] == results[2][1] == ""
+    assert "Line 1, in second" in results[1][1]
+    assert "one" not in results[1][1]
+    assert "Line 1, in fourth" in results[3][1]
+    assert "three" not in results[3][1]
+
+
+def test_run_doctests_stderr_is_a_stream():
+    """Test that tests in a batch can use sys.stderr like any text stream,
+    as logging, tqdm and warnings do."""
+    cases = [
+        ("isatty", ">>> import sys; sys.stderr.isatty()\nFalse\n", None),
+        (
+            "encoding",
+            ">>> import sys; sys.stderr.encoding is None\nTrue\n",
+            None,
+        ),
+        ("writable", ">>> import sys; sys.stderr.writable()\nTrue\n", None),
+    ]
+    results = abcok.run_doctests(cases, {})
+    assert results == [(True, ""), (True, ""), (True, "")]
@@ -0,0 +1,95 @@
+# Tests for roster.py
+
+from argparse import Namespace
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from abcclassroom.roster import Roster, students_from_args
+from abcclassroom.utils import parse_timestamp
+
+
+@pytest.fixture
+def roster_file(tmp_path):
+    path = Path(tmp_path, "classroom_roster.csv")
+    path.write_text(
+        '"identifier","github_username","github_id","name" \n'
+        '"Alana Smith"," alana ","1",""\n'
+        '"Bert Jones","","",""\n'
+        '"Cat Lee","cat","3","Cat"\n'
+    )
+    return path
+
+
+def test_roster_from_csv(roster_file):
+    roster = Roster.from_csv(roster_file)
+    assert len(roster) == 3
+    assert roster.usernames == ["alana", "cat"]
+    assert [s.identifier for s in roster.missing_usernames] == ["Bert Jones"]
+    assert roster.get("cat").name == "Cat"
+    assert roster.get("Alana Smith") is roster.get("alana")
+    assert roster.get("dan") is None
+
+
+def test_roster_wrong_header(tmp_path):
+    """Test that a roster without the required columns fails before any
+    rows are read."""
+    path = Path(tmp_path, "classroom_roster.csv")
+    path.write_text('"identifier","githubb_username"\n"a","b"\n')
+    with pytest.raises(KeyError, match="github_username"):
+        Roster.from_csv(path)
+
+
+def test_roster_filter(roster_file, capsys):
+    roster = Roster.from_csv(roster_file).filter(["cat", "Alana Smith", "dan"])
+    # roster order, not the order asked for
+    assert roster.usernames == ["alana", "cat"]
+    assert "dan is not in the roster" in capsys.readouterr().out
+
+
+class FakeRepository:
+    """Stands in for a github3 ShortRepository, which only has pushed_at in
+    its json data."""
+
+    def __init__(self, pushed_at):
+        self.pushed_at_json = pushed_at
+
+    def as_dict(self):
+        return {"pushed_at": self.pushed_at_json}
+
+
+def test_roster_pushed_since(roster_file):
+    roster = Roster.from_csv(roster_file)
+    repo_index = {
+        "hw1-alana": FakeRepository("2020-10-01T12:00:00Z"),
+        "hw1-cat": FakeRepository("2020-10-03T12:00:00Z"),
+    }
+    since = parse_timestamp("2020-10-02T00:00:00Z")
+    assert roster.pushed_since(repo_index, "hw1", since).usernames == ["cat"]
+    # no repos for this assignment
+    assert len(roster.pushed_since(repo_index, "hw2", since)) == 0
+
+
+def test_parse_timestamp():
+    utc = parse_timestamp("2020-10-01T17:00:00Z")
+    assert utc == datetime(2020, 10, 1, 17, tzinfo=timezone.utc)
+    assert parse_timestamp("2020-10-01 17:00").tzinfo is not None
+    assert parse_timestamp("2020-10-01").hour == 0
+    with pytest.raises(ValueError):
+        parse_timestamp("yesterday")
+
+
+def test_students_from_args(tmp_path):
+    students_file = Path(tmp_path, "late.txt")
+    students_file.write_text("# submitted late\nalana\n\n  cat  \n")
+    args = Namespace(student=["bert"], students_file=str(students_file))
+    assert students_from_args(args) == ["bert", "alana", "cat"]
+
+    args = Namespace(student=None, students_file=None)
+    assert students_from_args(args) is None
+
+    # an empty file selects nobody, rather than everybody
+    students_file.write_text("")
+    args = Namespace(student=None, students_file=str(students_file))
+    assert students_from_args(args) == []
@@ -0,0 +1,73 @@
+# Tests for scrub_feedback.py
+
+import os
+from pathlib import Path
+
+import pytest
+
+from abcclassroom.scrub_feedback import scrub_feedback
+
+report = (
+    "<html><body>\n"
+    "<pre>x = 1\n"
+    '<span class="c1">### BEGIN HIDDEN TESTS</span>\n'
+    "assert x == 1\n"
+    '<span class="c1">### END HIDDEN TESTS</span>\n'
+    "</pre>\n"
+    '<img src="data:image/png;base64,iVBORw0KGgo=">\n'
+    "<pre>y = 2\n"
+    '<span class="c1"># BEGIN HIDDEN TESTS</span>\n'
+    "assert y == 2\n"
+    '<span class="c1"># END HIDDEN TESTS</span>\n'
+    "</pre>\n"
+    "</body></html>\n"
+)
+
+
+@pytest.fixture
+def feedback_html(tmp_path):
+    path = Path(tmp_path, "feedback.html")
+    path.write_text(report)
+    return path
+
+
+def test_scrub_feedback_removes_hidden_tests(feedback_html):
+    assert scrub_feedback(feedback_html) == 2
+    cleaned = feedback_html.read_text()
+    assert "HIDDEN TESTS" not in cleaned
+    assert "assert" not in cleaned
+    assert "x = 1" in cleaned
+    assert "y = 2" in cleaned
+    assert "data:image/png" in cleaned
+    # only the cleaned file is left behind
+    assert os.listdir(feedback_html.parent) == ["feedback.html"]
+
+
+def test_scrub_feedback_mismatched_markers(tmp_path):
+    """Test that a ### BEGIN marker is not closed by a # END marker"""
+    path = Path(tmp_path, "feedback.html")
+    html = (
+        '<span class="c1">### BEGIN HIDDEN TESTS</span>\n'
+        '<span class="c1"># END HIDDEN TESTS</span>\n'
+    )
+    path.write_text(html)
+    assert scrub_feedback(path) == 0
+    assert path.read_text() == html
+
+
+def test_scrub_feedback_unchanged_file_not_rewritten(feedback_html):
+    scrub_feedback(feedback_html)
+    before = os.stat(feedback_html)
+    assert scrub_feedback(feedback_html) == 0
+    after = os.stat(feedback_html)
+    assert (before.st_ino, before.st_mtime_ns) == (
+        after.st_ino,
+        after.st_mtime_ns,
+    )
+
+
+def test_scrub_feedback_empty_file(tmp_path):
+    path = Path(tmp_path, "feedback.html")
+    path.touch()
+    assert scrub_feedback(path) == 0
+    assert path.read_text() == ""
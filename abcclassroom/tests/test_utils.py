@@ -0,0 +1,82 @@
+# Tests for the file copying helpers in utils
+
+import os
+import stat
+from pathlib import Path
+
+import abcclassroom.utils as abcutils
+
+
+def test_copy_file_fast_path(tmp_path, monkeypatch):
+    """Test that files big enough for the in-kernel copy keep their
+    contents and times."""
+    monkeypatch.setattr(abcutils, "FAST_COPY_MIN_SIZE", 1)
+    src = Path(tmp_path, "data.bin")
+    contents = os.urandom(300000)
+    src.write_bytes(contents)
+    os.utime(src, ns=(10**9, 10**9))
+    dst = Path(tmp_path, "copy.bin")
+    abcutils.copy_file(src, dst)
+    assert dst.read_bytes() == contents
+    assert dst.stat().st_mtime_ns == 10**9
+
+
+def test_copy_file_fallback(tmp_path, monkeypatch):
+    """Test that copy_file falls back to a regular copy when the in-kernel
+    copy fails."""
+
+    def fail(src, dst, size):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(abcutils, "FAST_COPY_MIN_SIZE", 1)
+    monkeypatch.setattr(abcutils, "_HAS_KERNEL_COPY", True)
+    monkeypatch.setattr(abcutils, "_kernel_copyfile", fail)
+    src = Path(tmp_path, "data.bin")
+    src.write_bytes(b"abc" * 1000)
+    dst = Path(tmp_path, "copy.bin")
+    abcutils.copy_file(src, dst)
+    assert dst.read_bytes() == b"abc" * 1000
+
+
+def test_link_file(tmp_path, monkeypatch):
+    """Test hardlinking and reflinking, and the fallback to a copy."""
+    src = Path(tmp_path, "nb.ipynb")
+    src.write_text("notebook")
+    dst = Path(tmp_path, "linked.ipynb")
+    assert abcutils.link_file(src, dst, "hardlink") == "hardlink"
+    assert dst.samefile(src)
+    # hardlinked files can't be edited in place through either name
+    assert not os.stat(dst).st_mode & (stat.S_IWUSR | stat.S_IWGRP)
+    # linking again is a no-op
+    assert abcutils.link_file(src, dst, "hardlink") == "hardlink"
+
+    # reflinks need a copy-on-write file system, so this may be a copy,
+    # but the link to src must be broken either way
+    assert abcutils.link_file(src, dst, "reflink") in ["reflink", "copy"]
+    assert not dst.samefile(src)
+    assert os.stat(src).st_mode & stat.S_IWUSR
+    assert dst.read_text() == src.read_text() == "notebook"
+
+    def fail(src, dst):
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(abcutils.os, "link", fail)
+    dst.unlink()
+    assert abcutils.link_file(src, dst, "hardlink") == "copy"
+    assert dst.read_text() == "notebook"
+
+
+def test_copy_file_kernel_copies_nothing(tmp_path, monkeypatch):
+    """Test that copy_file does a regular copy when the in-kernel copy
+    reports 0 bytes without copying anything, as it does on some file
+    systems."""
+    monkeypatch.setattr(abcutils, "FAST_COPY_MIN_SIZE", 1)
+    monkeypatch.setattr(abcutils, "_HAS_KERNEL_COPY", True)
+    monkeypatch.setattr(
+        abcutils.os, "copy_file_range", lambda *args: 0, raising=False
+    )
+    src = Path(tmp_path, "data.bin")
+    src.write_bytes(b"abc" * 1000)
+    dst = Path(tmp_path, "copy.bin")
+    abcutils.copy_file(src, dst)
+    assert dst.read_bytes() == b"abc" * 1000
@@ -5,21 +5,94 @@ abc-classroom.utils
 """
 
 
+import filecmp
 import os
+import shutil
+import stat
 import subprocess
 import sys
 import tempfile
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from shutil import copystat, copy2
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from pathlib import Path
+from shutil import copystat
 
 from IPython import get_ipython
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+# Files at least this big are copied inside the kernel (copy_file_range or
+# sendfile) rather than read into python and written out again
+FAST_COPY_MIN_SIZE = 1024 * 1024
+
+# Number of files sync_tree copies at the same time
+COPY_JOBS = 8
+
+# copy_file_range is new in python 3.8, and copying between files with
+# sendfile only works on linux
+_HAS_KERNEL_COPY = hasattr(os, "copy_file_range") or (
+    hasattr(os, "sendfile") and sys.platform.startswith("linux")
+)
+
+
+# Ways that link_file can put a file in place
+LINK_MODES = ["copy", "hardlink", "reflink"]
+
+# ioctl that makes dst share the data blocks of src (FICLONE in
+# linux/fs.h). Supported by copy-on-write file systems like btrfs and xfs.
+_FICLONE = 0x40049409
+
 
 class Error(OSError):
     pass
 
 
+def _kernel_copyfile(src, dst, size):
+    """Copy the contents of src to dst without reading them into python.
+    Returns the number of bytes copied, which is less than size if the
+    kernel stopped early."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        copied = 0
+        while copied < size:
+            if hasattr(os, "copy_file_range"):
+                n = os.copy_file_range(infd, outfd, size - copied)
+            else:
+                n = os.sendfile(outfd, infd, copied, size - copied)
+            if n == 0:
+                # some file systems report 0 bytes without copying anything
+                break
+            copied += n
+    return copied
+
+
+def copy_file(src, dst):
+    """Copy the file src to the file path dst, with its permissions and
+    times (like ``shutil.copy2``). Large files are copied in the kernel
+    with copy_file_range or sendfile where the platform has them, falling
+    back to ``shutil.copyfile`` if that fails or copies less than the whole
+    file (e.g. copying between file systems on older kernels)."""
+    size = os.stat(src).st_size
+    if _HAS_KERNEL_COPY and size >= FAST_COPY_MIN_SIZE:
+        try:
+            copied = _kernel_copyfile(src, dst, size)
+        except OSError:
+            copied = 0
+        if copied < size:
+            shutil.copyfile(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+    copystat(src, dst)
+    return dst
+
+
 # a copy of shutil.copytree() that is ok with the target directory
 # already existing
 def copytree(
@@ -27,7 +100,7 @@ def copytree(
     dst,
     symlinks=False,
     ignore=None,
-    copy_function=copy2,
+    copy_function=copy_file,
     ignore_dangling_symlinks=False,
 ):
     """Recursively copy a directory tree.
@@ -53,7 +126,7 @@ def copytree(
     not be copied.
     The optional copy_function argument is a callable that will be used
     to copy each file. It will be called with the source path and the
-    destination path as arguments. By default, copy2() is used, but any
+    destination path as arguments. By default, copy_file() is used, but any
     function that supports the same signature (like copy()) can be used.
     """
     names = os.listdir(src)
@@ -82,7 +155,8 @@ def copytree(
                     # ignore dangling symlink if the flag is on
                     if not os.path.exists(linkto) and ignore_dangling_symlinks:
                         continue
-                    # otherwise let the copy occurs. copy2 will raise an error
+                    # otherwise let the copy occurs. copy_file will raise an
+                    # error
                     if os.path.isdir(srcname):
                         copytree(
                             srcname, dstname, symlinks, ignore, copy_function
@@ -142,6 +216,218 @@ def get_abspath(testpath, coursepath):
         return os.path.join(coursepath, testpath)
 
 
+def _reflink(src, dst):
+    """Make dst a copy-on-write clone of src. Raises OSError if the file
+    system (or platform) can't do it."""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    copystat(src, dst)
+
+
+def _make_read_only(path):
+    """Remove all write permissions from the file at path."""
+    path_mode = stat.S_IMODE(os.stat(path).st_mode)
+    os.chmod(path, path_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def link_file(src, dst, mode="copy"):
+    """Put the file src at the file path dst, replacing any file there, by
+    copying it or linking it.
+
+    Parameters
+    ----------
+    src : path
+        File to copy or link.
+    dst : path
+        Path of the new file.
+    mode : string (default = "copy")
+        One of ``LINK_MODES``. "hardlink" makes dst another name for src,
+        so it takes no extra space. Changing the contents of one changes
+        the other: git replaces files rather than changing them, but
+        jupyter saves a notebook by writing to the same file. Hardlinked
+        files are therefore made read-only (which also makes src
+        read-only), so they can't be edited in place by accident. "reflink"
+        makes a copy that shares its data with src until one of them is
+        changed, on file systems that support it (btrfs, xfs). If the link
+        can't be made (e.g. src and dst are on different file systems), the
+        file is copied instead.
+
+    Returns
+    -------
+    string
+        The mode that was actually used.
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        if mode == "hardlink":
+            _make_read_only(dst)
+            return mode
+        # break the link first, so that we don't write to src through dst,
+        # and make src writable again
+        os.remove(dst)
+        os.chmod(src, stat.S_IMODE(os.stat(src).st_mode) | stat.S_IWUSR)
+    if mode == "hardlink":
+        try:
+            if os.path.lexists(dst):
+                os.remove(dst)
+            os.link(src, dst)
+            _make_read_only(dst)
+            return mode
+        except OSError:
+            pass
+    elif mode == "reflink":
+        try:
+            _reflink(src, dst)
+            return mode
+        except OSError:
+            pass
+    copy_file(src, dst)
+    return "copy"
+
+
+def sync_file(src, dst):
+    """Copy the file src to the path dst, unless dst already has the same
+    contents. Like rsync, files with the same size and modification time are
+    taken to be the same without reading them; otherwise the contents are
+    compared. Copies keep the modification time of src, so the next sync of
+    an unchanged file only needs a stat.
+
+    Returns "added" if dst did not exist, "updated" if it was replaced, and
+    None if it was already up to date.
+    """
+    if not os.path.exists(dst):
+        copy_file(src, dst)
+        return "added"
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+        copy_file(src, dst)
+        return "updated"
+    if filecmp.cmp(src, dst, shallow=True):
+        if os.stat(src).st_mtime_ns != os.stat(dst).st_mtime_ns:
+            # same contents; line up the times so the next check is quick
+            copystat(src, dst)
+        return None
+    copy_file(src, dst)
+    return "updated"
+
+
+def sync_tree(
+    src,
+    dst,
+    ignore=(),
+    exclude=(),
+    delete=False,
+    sync_function=sync_file,
+    jobs=COPY_JOBS,
+):
+    """Recursively sync the directory src into the directory dst, copying
+    only new and changed files (see ``sync_file``). The directories are
+    walked and created first, then the files are synced by a pool of
+    threads.
+
+    Parameters
+    ----------
+    src : path
+        Directory to copy from.
+    dst : path
+        Directory to copy to. It is created if it does not exist.
+    ignore : list of strings
+        Glob patterns (e.g. ``.DS_Store`` or ``*.pyc``). Files and
+        directories whose names match one of them are skipped at every level
+        of the tree, and are not deleted from dst.
+    exclude : list of strings
+        Names of files and directories at the top level of src that are not
+        copied, and that are not deleted from dst (e.g. ``.git``).
+    delete : boolean (default = False)
+        Delete files and directories in dst that are not in src.
+    sync_function : callable
+        Called with the source and destination paths to sync each file.
+        Must return "added", "updated" or None, like ``sync_file``.
+    jobs : int
+        Number of files to sync at the same time.
+
+    Returns
+    -------
+    dict
+        The paths (relative to dst, with forward slashes) of the files that
+        were "added", "updated", "removed" and "unchanged", sorted.
+    """
+    src = Path(src)
+    dst = Path(dst)
+
+    def skipped(rel, name):
+        if rel == Path() and name in exclude:
+            return True
+        return any(fnmatch(name, pattern) for pattern in ignore)
+
+    # walk src, making the directories in dst as we go
+    files = []
+    src_names = {}
+    changes = {"added": [], "updated": [], "removed": [], "unchanged": []}
+    to_walk = [Path()]
+    while to_walk:
+        rel = to_walk.pop()
+        target = Path(dst, rel)
+        if target.exists() and not target.is_dir():
+            target.unlink()
+            changes["removed"].append(rel.as_posix())
+        target.mkdir(parents=True, exist_ok=True)
+        src_names[rel] = set()
+        for entry in os.scandir(str(Path(src, rel))):
+            if skipped(rel, entry.name):
+                continue
+            src_names[rel].add(entry.name)
+            if entry.is_dir():
+                to_walk.append(Path(rel, entry.name))
+            else:
+                files.append(Path(rel, entry.name))
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = executor.map(
+            lambda rel: sync_function(Path(src, rel), Path(dst, rel)), files
+        )
+        for rel, change in zip(files, results):
+            changes[change or "unchanged"].append(rel.as_posix())
+
+    if delete:
+        for rel, names in src_names.items():
+            for entry in os.scandir(str(Path(dst, rel))):
+                if entry.name in names or skipped(rel, entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+                changes["removed"].append(Path(rel, entry.name).as_posix())
+
+    for paths in changes.values():
+        paths.sort()
+    return changes
+
+
+def parse_timestamp(text):
+    """
+    Parse a date or date and time like 2020-10-01, 2020-10-01 17:00 or
+    2020-10-01T17:00:00Z into a timezone aware datetime. Times ending in Z
+    are UTC, any others are taken to be local time.
+    Raises ValueError if text is not in one of these formats.
+    """
+    text = text.strip()
+    utc = text.endswith("Z")
+    if utc:
+        text = text[:-1]
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"):
+        try:
+            timestamp = datetime.strptime(text.replace("T", " "), fmt)
+        except ValueError:
+            continue
+        if utc:
+            return timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.astimezone()
+    raise ValueError("Can't read {!r} as a date and time".format(text))
+
+
 def write_file(filepath, contents):
     """Write a new file with the given path.
     Each item in contents is a line in the file.
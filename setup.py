@@ -63,6 +63,7 @@ setup(
             "abc-update-template = abcclassroom.__main__:update_template",
             "abc-clone = abcclassroom.__main__:clone",
             "abc-feedback = abcclassroom.__main__:feedback",
+            "abc-author = abcclassroom.__main__:author",
         ]
     },
     url="https://github.com/earthlab/abc-classroom",